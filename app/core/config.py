@@ -6,7 +6,103 @@ class Settings(pydantic_settings.BaseSettings):
     db_dsn: str
     secret_key: str
 
+    # Connection pool
+    db_pool_min: int = 2
+    db_pool_max: int = 10
+    db_pool_increment: int = 1
+    db_pool_timeout: int = 300  # seconds an idle connection above min is kept
+    db_pool_wait_timeout: int = 10000  # milliseconds to wait when acquiring a connection
+    db_pool_ping_interval: int = 60
+    db_stmt_cache_size: int = 50
+    db_call_timeout: int = 0  # milliseconds per round trip, 0 disables it
+    db_fetch_arraysize: int = 10000  # rows per fetch round trip and per fetched batch
+    db_prefetch_rows: int = 10000  # rows returned with the execute round trip
+    redo_ticket_chunk_size: int = 32767  # tickets bound per redoOutput query, at most 32767
+    db_parallel_queries: int = 4  # extra pooled connections one request may use at a time, out of DB_POOL_MAX - ADMISSION_DB_LIMIT shared by all requests
+    redo_shard_by: str = "month"  # "none", "month" or "days"
+    redo_shard_days: int = 31  # shard length when redo_shard_by is "days"
+
+    # Redo detection
+    redo_lookback_days: int = 90
+    redo_mode: str = "pandas"  # "pandas", "sql" or "index"
+
+    # Partitioned pipeline
+    redo_partitions: int = 16  # SERIALNO hash partitions of a partitioned run
+    redo_partition_min_days: int = 0  # ranges of at least this many days run partitioned, 0 only on request
+    partition_dir: str = ""  # spill directory, the system temp directory when empty
+
+    # Output
+    excel_engine: str = "xlsxwriter"  # "openpyxl", "write_only" or "xlsxwriter"
+    excel_spool_max_size: int = 16 * 1024 * 1024  # bytes kept in memory before spilling to disk
+    export_batch_rows: int = 50000  # rows encoded at a time for csv, parquet and ndjson
+    batch_max_specs: int = 200  # account groups one /redo/batch request may ask for
+
+    # Execution of the pandas and Excel stages
+    execution_mode: str = "thread"  # "thread" or "process"
+    process_workers: int = 2
+
+    # Admission control
+    admission_db_limit: int = 8  # requests holding a database session at a time
+    admission_cpu_limit: int = 2  # pandas stages running at a time
+    admission_excel_limit: int = 2  # workbooks being written at a time
+    admission_queue_depth: int = 20  # requests waiting for the database stage before new ones get 503
+    admission_retry_after: int = 10  # seconds sent in Retry-After
+    admission_priority_lane: bool = True
+    admission_small_days: int = 31  # date ranges up to this many days use the priority lane
+
+    # Row API
+    rows_ttl: int = 300  # seconds a materialized /redo/rows result is kept in memory, 0 recomputes it every page
+    rows_cache_bytes: int = 256 * 1024 * 1024  # memory for materialized results, least recently used go first
+    rows_page_size: int = 500
+    rows_max_page_size: int = 10000
+
+    # Conditional requests
+    etag_enabled: bool = True  # tag redo reports with a data version probe and answer a matching If-None-Match with 304
+
+    # Logging
+    log_level: str = "INFO"
+    log_file: str = "redo.log"  # JSON lines, empty logs to the console only
+    log_max_bytes: int = 10 * 1024 * 1024  # size at which the log file is rotated
+    log_backup_count: int = 5  # rotated files kept
+    log_queue_size: int = 10000  # records waiting for the writer thread before new ones are dropped
+    log_max_items: int = 20  # items of a logged list, tuple, set or dict before the rest is summarized
+    log_max_field_length: int = 1000  # characters of a logged argument or extra field
+    log_max_message_length: int = 4000  # characters of a formatted message
+
+    # Metrics
+    server_timing: bool = False  # add a Server-Timing header with the stage durations to redo responses
+
+    # Request coalescing
+    singleflight_max_keys: int = 1000  # request keys kept in the coalescing metrics
+
+    # Result cache
+    cache_enabled: bool = True
+    cache_dir: str = "cache"
+    cache_memory_bytes: int = 512 * 1024 * 1024
+    cache_disk_bytes: int = 5 * 1024 * 1024 * 1024
+    cache_ttl: int = 30 * 24 * 60 * 60  # seconds closed months are kept
+    cache_current_ttl: int = 0  # seconds the current month is kept, 0 recomputes it every request
+
+    # Local redo index
+    index_enabled: bool = False
+    index_path: str = "index/tickets.sqlite"
+    index_start_date: str = "2023-01-01"  # first COMPLETEDTIME pulled by the initial sync
+    index_sync_interval: int = 300  # seconds between syncs
+    index_sync_overlap: int = 600  # seconds re-read before the watermark to catch late commits
+    index_sync_batch_rows: int = 10000
+    # Tickets carry no update time, so changes to synced tickets (STATUS, WARRANTYSTATUS, SERVICETYPE)
+    # only reach the index when the last index_resync_days days are re-read; older tickets stay as synced
+    index_resync_interval: int = 3600  # seconds between re-reads, 0 turns them off
+    index_resync_days: int = 120  # days of COMPLETEDTIME re-read, 0 re-reads everything since index_start_date
+
+    # Background jobs
+    job_workers: int = 2
+    job_queue_size: int = 20
+    job_dir: str = "jobs"  # results of a previous process are removed at startup
+    job_ttl: int = 24 * 60 * 60  # seconds a finished job and its result are kept
+    job_cleanup_interval: int = 300
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,138 @@
+"""Logging off the request path. Records go through a QueueHandler onto a bounded queue and a
+QueueListener thread writes them to the console and, as JSON lines, to a rotating log file."""
+import copy
+import json
+import logging
+import os
+import queue
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from app.core.config import settings
+
+# Id of the request or job the records are logged for, None outside of one
+requestId = ContextVar("requestId", default=None)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has, the others were passed in extra
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_handler = None
+_listener = None
+_dropped = 0
+
+
+def truncateValue(value, max_length: int = None):
+    """value in a size fit for a log record. Collections longer than log_max_items keep their first
+    items and a count of the rest, strings keep their first max_length characters."""
+    max_length = max_length or settings.log_max_field_length
+    if isinstance(value, (list, tuple, set, frozenset, dict)) and len(value) > settings.log_max_items:
+        items = ", ".join(map(repr, islice(value, settings.log_max_items)))
+        return f"{type(value).__name__}[{items}, ... {len(value) - settings.log_max_items} more]"
+    if isinstance(value, str) and len(value) > max_length:
+        return f"{value[:max_length]}... {len(value) - max_length} more characters"
+    return value
+
+
+class _QueueHandler(QueueHandler):
+    """prepare runs in the thread that logs, the event loop for most records: large arguments are
+    truncated first, so formatting the message and any traceback there stays cheap. The writer
+    thread only encodes and writes. Records are dropped when it falls behind instead of blocking
+    the caller."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = {key: truncateValue(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(truncateValue(arg) for arg in record.args)
+        record.message = truncateValue(record.getMessage(), settings.log_max_message_length)
+        record.msg, record.args = record.message, None
+        # The traceback refers to the caller's frames, so it is rendered before the record is queued
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for key in vars(record).keys() - _RECORD_ATTRIBUTES:
+            setattr(record, key, truncateValue(getattr(record, key)))
+        record.request_id = requestId.get()
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # emit runs under the handler lock, so the count doesn't race
+            _dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the time, level, logger, message, request id, the fields
+    passed in extra and the traceback"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+def setupLogging():
+    """Send the records of the root logger through the queue to the writer thread. Replaces the
+    handlers of an earlier call."""
+    global _handler, _listener
+    stopLogging()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if settings.log_file:
+        directory = os.path.dirname(settings.log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file = RotatingFileHandler(
+            settings.log_file,
+            maxBytes=settings.log_max_bytes,
+            backupCount=settings.log_backup_count,
+            encoding="utf-8",
+            delay=True
+        )
+        file.setFormatter(JsonFormatter())
+        handlers.append(file)
+
+    _handler = _QueueHandler(queue.Queue(settings.log_queue_size))
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    root = logging.getLogger()
+    root.setLevel(settings.log_level.upper())
+    root.addHandler(_handler)
+
+
+def stopLogging():
+    """Write the queued records and stop the writer thread"""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _handler = _listener = None
+
+
+def getLogStats():
+    return {
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _dropped,
+    }
@@ -1,10 +1,125 @@
 import oracledb
+import logging
+import threading
 from app.core.config import settings
 
-def getConnection():
-    """Get synchronous connection - will be used in async context via thread pools"""
-    return oracledb.connect(
+logger = logging.getLogger(__name__)
+
+_pool = None
+_parallel_lock = threading.Lock()
+_parallel_in_use = 0
+
+
+def _initSession(connection, requested_tag):
+    """Session callback - runs once for every newly created pooled session"""
+    connection.module = "KW-AIRO-KPI-API"
+    if settings.db_call_timeout:
+        connection.call_timeout = settings.db_call_timeout
+
+
+def parallelSessionBudget():
+    """Sessions of the pool left for the extra shard and chunk queries of requests: the pool size
+    minus one session for every request the db admission stage lets in and one for the index sync"""
+    reserved = settings.admission_db_limit + (1 if settings.index_enabled else 0)
+    return max(0, settings.db_pool_max - reserved)
+
+
+def reserveParallelSession():
+    """Take a session of the parallel budget without waiting, False when it is used up"""
+    global _parallel_in_use
+    with _parallel_lock:
+        if _parallel_in_use >= parallelSessionBudget():
+            return False
+        _parallel_in_use += 1
+        return True
+
+
+def releaseParallelSession():
+    global _parallel_in_use
+    with _parallel_lock:
+        _parallel_in_use -= 1
+
+
+def createPool():
+    """Create the shared connection pool and warm it up to its minimum size"""
+    global _pool
+    if _pool is not None:
+        return _pool
+
+    reserved = settings.admission_db_limit + (1 if settings.index_enabled else 0)
+    if reserved > settings.db_pool_max:
+        logger.warning(
+            "ADMISSION_DB_LIMIT %s plus the index sync needs %s sessions, DB_POOL_MAX is %s: admitted requests will wait for the pool",
+            settings.admission_db_limit, reserved, settings.db_pool_max
+        )
+
+    _pool = oracledb.create_pool(
         user=settings.db_user,
         password=settings.db_password,
         dsn=settings.db_dsn,
-    )
\ No newline at end of file
+        min=settings.db_pool_min,
+        max=settings.db_pool_max,
+        increment=settings.db_pool_increment,
+        timeout=settings.db_pool_timeout,
+        wait_timeout=settings.db_pool_wait_timeout,
+        ping_interval=settings.db_pool_ping_interval,
+        stmtcachesize=settings.db_stmt_cache_size,
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+        session_callback=_initSession,
+    )
+
+    # Acquire and ping min connections so the first requests don't pay for session setup
+    warm = []
+    try:
+        for _ in range(settings.db_pool_min):
+            connection = _pool.acquire()
+            connection.ping()
+            warm.append(connection)
+    finally:
+        for connection in warm:
+            _pool.release(connection)
+
+    logger.info("Connection pool created with %s open connections", _pool.opened)
+    return _pool
+
+
+def closePool():
+    """Close the shared connection pool"""
+    global _pool
+    if _pool is None:
+        return
+    _pool.close(force=True)
+    _pool = None
+    logger.info("Connection pool closed")
+
+
+def getPool():
+    """Get the shared connection pool, creating it on first use"""
+    if _pool is None:
+        return createPool()
+    return _pool
+
+
+def getConnection():
+    """Get synchronous connection from the pool - will be used in async context via thread pools.
+    Calling close() on the connection returns it to the pool."""
+    return getPool().acquire()
+
+
+def getPoolStats():
+    """Get connection pool statistics for monitoring"""
+    if _pool is None:
+        return {"status": "closed"}
+    return {
+        "status": "open",
+        "opened": _pool.opened,
+        "busy": _pool.busy,
+        "min": _pool.min,
+        "max": _pool.max,
+        "increment": _pool.increment,
+        "timeout": _pool.timeout,
+        "wait_timeout": _pool.wait_timeout,
+        "stmtcachesize": _pool.stmtcachesize,
+        "parallel_budget": parallelSessionBudget(),
+        "parallel_in_use": _parallel_in_use,
+    }
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import oracledb
+import pandas as pd
+from app.core.config import settings
+from app.db.connection import getConnection
+from app.db.schema import applyInputSchema
+from app.utils.metrics import countRoundTrips
+from app.utils.process import validateDateFormat
+
+logger = logging.getLogger(__name__)
+
+# Columns of the redoInput output, in the same order
+INPUT_COLUMNS = [
+    "TICKETNO", "NICKNAME", "ACCOUNTNO", "BUILDERNAME", "PRODUCTTYPE", "SERVICETYPE", "MODELNO",
+    "SERIALNO", "UPDATEDBY", "VENDORID", "WARRANTYSTATUS", "ASSIGNDATE", "APPTDATE", "OPENDATE",
+    "COMPLETEDATE", "COMPLETEMONTH", "STATUS", "BRAND", "TECHID", "TECHNAME",
+]
+# Full timestamps kept for the watermark and the redoOutput columns
+INDEX_COLUMNS = INPUT_COLUMNS + ["ASSIGNDTIME", "COMPLETEDTIME"]
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+SYNC_QUERY = """
+    SELECT
+        t.ticketno,
+        wh.nickname,
+        t.ACCOUNTNO,
+        t.buildername,
+        t.PRODUCTTYPE,
+        t.SERVICETYPE,
+        t.modelno,
+        t.SERIALNO,
+        b.UPDATEDBY,
+        CASE t.vendorid
+            WHEN 0 THEN 'Unknown'
+            WHEN 1 THEN 'GSPN'
+        END as VendorID,
+        t.WARRANTYSTATUS,
+        TO_CHAR(t.ASSIGNDTIME, 'YYYY-MM-DD') AS assigndate,
+        TO_CHAR(t.APTSTARTDTIME, 'YYYY-MM-DD') AS apptdate,
+        TO_CHAR(t.issuedtime, 'YYYY-MM-DD') AS Opendate,
+        TO_CHAR(t.COMPLETEDTIME, 'YYYY-MM-DD') AS completedate,
+        TO_CHAR(t.COMPLETEDTIME, 'YYYY_MM') AS completemonth,
+        b.status,
+        t.BRAND,
+        t.TECHID,
+        U.FirstName || ' ' || U.LastName AS TechName,
+        t.ASSIGNDTIME,
+        t.COMPLETEDTIME
+    FROM opticket t
+    INNER JOIN nspwarehouses wh ON wh.warehouseid = t.warehouseid
+    INNER JOIN opbase b ON b.id = t.id
+    INNER JOIN nspusers u ON t.techid = u.userid
+    WHERE t.COMPLETEDTIME > :watermark
+    AND t.vendorid = 1
+    AND t.systemid = 2
+    AND t.servicetype = 'IH'
+    ORDER BY t.COMPLETEDTIME
+"""
+
+_sync_task = None
+
+
+@contextmanager
+def _connect():
+    """SQLite connection to the index that commits on success and is always closed"""
+    connection = sqlite3.connect(settings.index_path, timeout=30)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def initIndex():
+    """Create the local ticket store and its indexes"""
+    directory = os.path.dirname(settings.index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _connect() as connection:
+        columns = ", ".join(f"{column} INTEGER PRIMARY KEY" if column == "TICKETNO" else column for column in INDEX_COLUMNS)
+        connection.execute(f"CREATE TABLE IF NOT EXISTS tickets ({columns})")
+        connection.execute("CREATE INDEX IF NOT EXISTS tickets_serial ON tickets (SERIALNO, COMPLETEDTIME)")
+        connection.execute("CREATE INDEX IF NOT EXISTS tickets_completed ON tickets (COMPLETEDTIME)")
+        connection.execute("CREATE INDEX IF NOT EXISTS tickets_account ON tickets (ACCOUNTNO, COMPLETEDTIME)")
+        connection.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+
+
+def _getState(name: str):
+    with _connect() as connection:
+        row = connection.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def getWatermark():
+    """COMPLETEDTIME of the latest ticket in the index, or None before the first sync"""
+    return _getState("watermark")
+
+
+def indexReady():
+    try:
+        return getWatermark() is not None
+    except sqlite3.Error:
+        return False
+
+
+def resyncDue():
+    """Whether index_resync_interval seconds passed since the last re-read of recent tickets"""
+    if settings.index_resync_interval <= 0:
+        return False
+    resynced = _getState("resynced")
+    if resynced is None:
+        return True
+    elapsed = datetime.now() - datetime.strptime(resynced, TIMESTAMP_FORMAT)
+    return elapsed.total_seconds() >= settings.index_resync_interval
+
+
+def getIndexStats():
+    """Watermark, time of the last re-read and the COMPLETEDTIME it started from"""
+    if not settings.index_enabled:
+        return {"status": "disabled"}
+    try:
+        return {
+            "status": "ready" if indexReady() else "syncing",
+            "watermark": getWatermark(),
+            "resynced": _getState("resynced"),
+            "resynced_from": _getState("resynced_from"),
+        }
+    except sqlite3.Error as e:
+        return {"status": f"error: {e}"}
+
+
+def _toText(value):
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
+
+
+def syncIndex(connection: oracledb.Connection, resync: bool = False):
+    """Pull tickets completed after the watermark into the local index. Returns the number of rows synced.
+    The sync starts index_sync_overlap seconds before the watermark to pick up late commits;
+    rows are upserted by TICKETNO so the overlap is harmless.
+
+    Tickets don't carry an update time, so a ticket whose STATUS, WARRANTYSTATUS or SERVICETYPE
+    changes after it was synced is only picked up by a resync: the tickets completed in the last
+    index_resync_days days (all of them when 0) are deleted and read again in one transaction,
+    so readers see either the old rows or the new ones."""
+    watermark = getWatermark()
+    # The first sync reads everything, it counts as a resync but commits batch by batch
+    initial = watermark is None
+    resync = resync and not initial
+    if initial or (resync and settings.index_resync_days <= 0):
+        since = datetime.strptime(settings.index_start_date, "%Y-%m-%d")
+    elif resync:
+        since = datetime.now() - timedelta(days=settings.index_resync_days)
+    else:
+        since = datetime.strptime(watermark, TIMESTAMP_FORMAT) - timedelta(seconds=settings.index_sync_overlap)
+    started = datetime.now()
+
+    placeholders = ", ".join("?" for _ in INDEX_COLUMNS)
+    insert = f"INSERT OR REPLACE INTO tickets ({', '.join(INDEX_COLUMNS)}) VALUES ({placeholders})"
+    state = "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)"
+    synced = 0
+    with connection.cursor() as cursor, _connect() as index:
+        if resync:
+            # Tickets that no longer match the sync query drop out of the window
+            index.execute("DELETE FROM tickets WHERE COMPLETEDTIME > ?", (_toText(since),))
+        cursor.arraysize = settings.index_sync_batch_rows
+        cursor.execute(SYNC_QUERY, watermark=since)
+        countRoundTrips(1)
+        while True:
+            rows = cursor.fetchmany()
+            countRoundTrips(1, len(rows))
+            if not rows:
+                break
+            index.executemany(insert, [tuple(_toText(value) for value in row) for row in rows])
+            # Rows arrive ordered by COMPLETEDTIME, the last one moves the watermark
+            latest = _toText(rows[-1][-1])
+            if watermark is None or latest > watermark:
+                watermark = latest
+                index.execute(state, ("watermark", watermark))
+            if not resync:
+                index.commit()
+            synced += len(rows)
+        if initial or resync:
+            index.execute(state, ("resynced", _toText(started)))
+            index.execute(state, ("resynced_from", _toText(since)))
+    logger.info("Synced %s tickets into the local index%s, watermark %s", synced, " (resync)" if resync else "", watermark)
+    return synced
+
+
+async def _syncLoop():
+    while True:
+        connection = None
+        try:
+            connection = await asyncio.to_thread(getConnection)
+            resync = await asyncio.to_thread(resyncDue)
+            await asyncio.to_thread(syncIndex, connection, resync)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error syncing local index: %s", e)
+        finally:
+            if connection:
+                await asyncio.to_thread(connection.close)
+        await asyncio.sleep(settings.index_sync_interval)
+
+
+def startIndexSync():
+    """Start the background sync task. initIndex must have been called."""
+    global _sync_task
+    _sync_task = asyncio.create_task(_syncLoop())
+
+
+async def stopIndexSync():
+    global _sync_task
+    if _sync_task is None:
+        return
+    _sync_task.cancel()
+    await asyncio.gather(_sync_task, return_exceptions=True)
+    _sync_task = None
+
+
+def _rangeParams(start_date: str, end_date: str):
+    # Same range as COMPLETEDTIME BETWEEN TO_DATE(start) AND TO_DATE(end)
+    return [f"{start_date} 00:00:00.000000", f"{end_date} 00:00:00.000000"]
+
+
+async def indexInput(start_date: str, end_date: str, accountNo: list):
+    """redoInput answered from the local index"""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    query = f"SELECT {', '.join(INPUT_COLUMNS)} FROM tickets WHERE COMPLETEDTIME BETWEEN ? AND ?"
+    params = _rangeParams(start_date, end_date)
+    if accountNo:
+        query += " AND ACCOUNTNO IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps([str(x) for x in accountNo]))
+
+    def _read():
+        with _connect() as connection:
+            return applyInputSchema(pd.read_sql(query, connection, params=params))
+
+    return await asyncio.to_thread(_read)
+
+
+async def streamIndexInput(start_date: str, end_date: str, accountNo: list, batch_rows: int = None):
+    """indexInput as an async iterator of batches in the extraction schema"""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    query = f"SELECT {', '.join(INPUT_COLUMNS)} FROM tickets WHERE COMPLETEDTIME BETWEEN ? AND ?"
+    params = _rangeParams(start_date, end_date)
+    if accountNo:
+        query += " AND ACCOUNTNO IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps([str(x) for x in accountNo]))
+
+    def _read():
+        with _connect() as connection:
+            for df in pd.read_sql(query, connection, params=params, chunksize=batch_rows or settings.db_fetch_arraysize):
+                yield applyInputSchema(df)
+
+    batches = _read()
+    try:
+        while (df := await asyncio.to_thread(next, batches, None)) is not None:
+            yield df
+    finally:
+        await asyncio.to_thread(batches.close)
+
+
+async def indexVersion(start_date: str, end_date: str, accountNo: list):
+    """dataVersion answered from the local index"""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    query = "SELECT MAX(COMPLETEDTIME), COUNT(*) FROM tickets WHERE COMPLETEDTIME BETWEEN ? AND ?"
+    params = _rangeParams(start_date, end_date)
+    if accountNo:
+        query += " AND ACCOUNTNO IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps([str(x) for x in accountNo]))
+
+    def _read():
+        with _connect() as connection:
+            latest, tickets = connection.execute(query, params).fetchone()
+        return latest, tickets
+
+    return await asyncio.to_thread(_read)
+
+
+async def indexOutput(tuple_tickets: tuple, start_date: str, end_date: str):
+    """redoOutput answered from the local index"""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    tickets = sorted({int(str(ticket).strip()) for ticket in tuple_tickets})
+    if not tickets:
+        return pd.DataFrame()
+
+    query = """
+        SELECT TICKETNO AS REDOTKTNO, NICKNAME AS REDOLOC, ACCOUNTNO AS REDOACCT,
+            ASSIGNDTIME AS REDOASSIGNDATE, COMPLETEDTIME AS REDOCALCCOMPLETE,
+            TECHID, TECHNAME AS REDOTECHNAME
+        FROM tickets
+        WHERE COMPLETEDTIME BETWEEN ? AND ?
+        AND TICKETNO IN (SELECT value FROM json_each(?))
+    """
+    params = _rangeParams(start_date, end_date) + [json.dumps(tickets)]
+
+    def _read():
+        with _connect() as connection:
+            df = pd.read_sql(query, connection, params=params)
+        # Same columns and types as the Oracle query
+        df["REDOASSIGNDATE"] = pd.to_datetime(df["REDOASSIGNDATE"], format=TIMESTAMP_FORMAT)
+        df["REDOCALCCOMPLETE"] = pd.to_datetime(df["REDOCALCCOMPLETE"], format=TIMESTAMP_FORMAT)
+        df.insert(5, "REDOCOMPLETEDATE", df["REDOCALCCOMPLETE"].dt.strftime("%m/%d/%Y"))
+        df.insert(6, "REDOCOMPLETEMONTH", df["REDOCALCCOMPLETE"].dt.strftime("%Y_%m"))
+        return df
+
+    return await asyncio.to_thread(_read)
@@ -1,32 +1,74 @@
 from app.utils.process import validateDateFormat
+from app.db.connection import getConnection, reserveParallelSession, releaseParallelSession
+from app.core.config import settings
 import oracledb
 import pandas as pd
 import asyncio
 import logging
+import threading
+from datetime import date, datetime, timedelta
+from app.utils.cache import cacheGet, cachePut
+from app.db.schema import applyInputSchema, concatInput
+from app.utils.metrics import countRoundTrips
 
 logger = logging.getLogger(__name__)
 
-async def redoInput(start_date: str, end_date: str, accountNo: list, connection: oracledb.Connection):
-    # Validate date formats as additional safety
-    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
-        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+# SYS.ODCINUMBERLIST is a VARRAY(32767) OF NUMBER available in every Oracle database
+TICKET_LIST_TYPE = "SYS.ODCINUMBERLIST"
+TICKET_LIST_MAX = 32767
 
-    logger.info(f"Start date: {start_date}")
-    logger.info(f"End date: {end_date}")
-    logger.info(f"Account no: {accountNo}")
-    accountNoQuery = redoAccount(accountNo)
-    logger.info(f"Account no query: {accountNoQuery}")
+# SYS.ODCIVARCHAR2LIST is a VARRAY(32767) OF VARCHAR2(4000)
+ACCOUNT_LIST_TYPE = "SYS.ODCIVARCHAR2LIST"
+ACCOUNT_LIST_MAX = 32767
 
-    query = """
+ALL_ACCOUNTS = "*"
+
+_statement_lock = threading.Lock()
+_statement_counts = {}
+_statement_stats = {'hits': 0, 'misses': 0}
+
+REDO_OUTPUT_QUERY = """
+    SELECT t.ticketno AS redotktno ,wh.nickname AS redoloc,t.ACCOUNTNO AS redoacct
+    ,t.ASSIGNDTIME AS redoassigndate
+    , t.completedtime AS redocalccomplete
+    ,to_char(t.COMPLETEDTIME, 'mm/dd/yyyy') AS redocompletedate ,to_char(t.COMPLETEDTIME, 'yyyy_mm') AS redocompletemonth
+    ,t.TECHID , U.FirstName || ' ' || U.LastName AS redotechname
+    FROM opticket t
+    INNER JOIN nspwarehouses wh ON wh.warehouseid = t.warehouseid
+    INNER JOIN opbase b ON b.id = t.id
+    INNER JOIN nspusers u ON t.techid = u.userid
+    WHERE t.COMPLETEDTIME BETWEEN TO_DATE(:start_date, 'YYYY-MM-DD') AND TO_DATE(:end_date, 'YYYY-MM-DD')
+    AND t.vendorid = 1
+    AND t.systemid = 2
+    AND t.servicetype = 'IH'
+    AND t.TICKETNO IN (SELECT column_value FROM TABLE(:ticket_ids))
+"""
+
+# Columns of the redoOutput frame, in the same order
+REDO_OUTPUT_COLUMNS = [
+    "REDOTKTNO", "REDOLOC", "REDOACCT", "REDOASSIGNDATE", "REDOCALCCOMPLETE",
+    "REDOCOMPLETEDATE", "REDOCOMPLETEMONTH", "TECHID", "REDOTECHNAME",
+]
+
+def emptyRedoOutput():
+    """redoOutput frame without rows, for merging tickets that have no redo"""
+    df = pd.DataFrame(columns=REDO_OUTPUT_COLUMNS)
+    df['REDOTKTNO'] = df['REDOTKTNO'].astype('float64')
+    return df
+
+def redoInputQuery(accountNo: list, last_shard: bool = True):
+    """redoInput statement. Every shard but the last excludes its end date so shards don't overlap."""
+    end_operator = "<=" if last_shard else "<"
+    return """
     WITH filtered_tickets AS (
         SELECT t.* 
         FROM opticket t
-        WHERE t.COMPLETEDTIME BETWEEN TO_DATE(:start_date, 'YYYY-MM-DD') 
-            AND TO_DATE(:end_date, 'YYYY-MM-DD')
+        WHERE t.COMPLETEDTIME >= TO_DATE(:start_date, 'YYYY-MM-DD') 
+            AND t.COMPLETEDTIME """ + end_operator + """ TO_DATE(:end_date, 'YYYY-MM-DD')
         AND t.vendorid = 1
         AND t.systemid = 2
         AND t.servicetype = 'IH'
-    """ + accountNoQuery + """
+    """ + redoAccount(accountNo) + """
 )
     SELECT 
         t.ticketno,
@@ -58,8 +100,166 @@ async def redoInput(start_date: str, end_date: str, accountNo: list, connection:
     INNER JOIN opbase b ON b.id = t.id
     INNER JOIN nspusers u ON t.techid = u.userid
     """
+
+def partitionTtl(shard_end: str, last_shard: bool):
+    """Cache lifetime of a shard. Shards that end before the current month are closed and
+    treated as immutable, shards reaching into the current month are recomputed."""
+    current_month = date.today().replace(day=1)
+    end = datetime.strptime(shard_end, '%Y-%m-%d').date()
+    if end < current_month or (end == current_month and not last_shard):
+        return settings.cache_ttl
+    return settings.cache_current_ttl
+
+def partitionMatches(key: list, month: str = None, accountNo: str = None):
+    """Whether a redoInput cache key covers month (YYYY-MM) and accountNo"""
+    if key[0] != "redoInput":
+        return False
+    if month and not (key[1][:7] <= month <= key[2][:7]):
+        return False
+    if accountNo and key[4] not in (accountNo, ALL_ACCOUNTS):
+        return False
+    return True
+
+def dateShards(start_date: str, end_date: str, shard_by: str = None, shard_days: int = None):
+    """Split [start_date, end_date] into (start, end, last) shards by calendar month or by a number of days"""
+    shard_by = shard_by or settings.redo_shard_by
+    shard_days = shard_days or settings.redo_shard_days
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    if shard_by == "none" or start >= end:
+        return [(start_date, end_date, True)]
+
+    shards = []
+    shard_start = start
+    while True:
+        if shard_by == "month":
+            shard_end = (shard_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            shard_end = shard_start + timedelta(days=shard_days)
+        if shard_end >= end:
+            shards.append((shard_start.isoformat(), end_date, True))
+            return shards
+        shards.append((shard_start.isoformat(), shard_end.isoformat(), False))
+        shard_start = shard_end
+
+async def gatherPooled(fn, args_list: list, connection: oracledb.Connection):
+    """Run fn(*args, conn) for every args in args_list and return the results in order.
+    connection works through the list, helped by up to db_parallel_queries more pooled connections.
+    Those come out of the parallel session budget shared by all requests and are only taken when
+    the budget has room, so the extra queries never wait on a pool the admitted requests fill.
+    The first call that raises stops the others from taking more work, and the error is raised
+    once every worker is done, so nothing runs on connection after this returns."""
+    results = [None] * len(args_list)
+    pending = iter(range(len(args_list)))
+    errors = []
+
+    async def _work(conn):
+        # The workers share the iterator, each takes the next call when it is done with one
+        while not errors:
+            index = next(pending, None)
+            if index is None:
+                return
+            try:
+                results[index] = await asyncio.to_thread(fn, *args_list[index], conn)
+            except Exception as e:
+                errors.append(e)
+
+    async def _workPooled():
+        try:
+            try:
+                conn = await asyncio.to_thread(getConnection)
+            except Exception as e:
+                # The request's own connection does the rest
+                logger.warning("Error acquiring a parallel connection: %s", e)
+                return
+            try:
+                await _work(conn)
+            finally:
+                await asyncio.to_thread(conn.close)
+        finally:
+            releaseParallelSession()
+
+    workers = [asyncio.ensure_future(_work(connection))]
+    for _ in range(min(settings.db_parallel_queries, len(args_list) - 1)):
+        if not reserveParallelSession():
+            break
+        workers.append(asyncio.ensure_future(_workPooled()))
+    try:
+        await asyncio.wait(workers)
+    except asyncio.CancelledError:
+        # The calls in flight can't be interrupted, wait for them before the caller releases connection
+        errors.append(None)
+        await asyncio.wait(workers)
+        raise
+    for worker in workers:
+        # Errors outside of fn, closing a helper connection
+        if worker.exception() is not None:
+            errors.append(worker.exception())
+    if errors:
+        raise errors[0]
+    return results
+
+async def redoInput(start_date: str, end_date: str, accountNo: list, connection: oracledb.Connection):
+    # Validate date formats as additional safety
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    logger.info("Retrieving tickets from %s to %s for %s account numbers", start_date, end_date, len(accountNo) or "all")
+    logger.debug("Account numbers: %s", accountNo)
+
+    # Redo detection runs on the concatenated frame, so shards only need to cover the range once
+    shards = dateShards(start_date, end_date)
+    logger.info("Date shards: %s", len(shards))
+
+    # Partitions are cached per shard and account, "*" stands for all accounts
+    accounts = list(dict.fromkeys(str(x) for x in accountNo)) or [ALL_ACCOUNTS]
+
+    def _read(shard_start, shard_end, last_shard, conn):
+        ttl = partitionTtl(shard_end, last_shard) if settings.cache_enabled else 0
+        parts = {}
+        if ttl > 0:
+            for account in accounts:
+                parts[account] = cacheGet(("redoInput", shard_start, shard_end, last_shard, account))
+        missing = [account for account in accounts if parts.get(account) is None]
+        if not missing:
+            return concatInput([parts[account] for account in accounts])
+
+        fetch_accounts = [] if missing == [ALL_ACCOUNTS] else missing
+        params = {'start_date': shard_start, 'end_date': shard_end}
+        params.update(redoAccountParams(fetch_accounts, conn))
+        df = readSql(redoInputQuery(fetch_accounts, last_shard), conn, params, transform=applyInputSchema)
+        if ttl <= 0:
+            return df
+
+        if missing == [ALL_ACCOUNTS]:
+            fetched = {ALL_ACCOUNTS: df}
+        else:
+            account_column = df['ACCOUNTNO'].astype(str)
+            fetched = {account: df[account_column == account].reset_index(drop=True) for account in missing}
+            if sum(len(part) for part in fetched.values()) != len(df):
+                # Account numbers didn't round trip as strings, don't cache a partial split
+                logger.warning("Could not split shard by account, skipping cache")
+                return concatInput([df] + [parts[account] for account in accounts if parts.get(account) is not None])
+        for account, part in fetched.items():
+            cachePut(("redoInput", shard_start, shard_end, last_shard, account), part, ttl)
+            parts[account] = part
+        return concatInput([parts[account] for account in accounts])
+
     # Run pandas read_sql in thread pool to avoid blocking
-    return await asyncio.to_thread(pd.read_sql, query, con=connection, params={'start_date': start_date, 'end_date': end_date})
+    frames = await gatherPooled(_read, shards, connection)
+    return concatInput(frames)
+
+async def streamRedoInput(start_date: str, end_date: str, accountNo: list, connection: oracledb.Connection):
+    """redoInput as an async iterator of fetched batches in the extraction schema. Shards are
+    read one after the other on connection and bypass the cache, so only one batch is in memory."""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    account_params = await asyncio.to_thread(redoAccountParams, accountNo, connection)
+    for shard_start, shard_end, last_shard in dateShards(start_date, end_date):
+        params = {'start_date': shard_start, 'end_date': shard_end, **account_params}
+        async for df in streamSql(redoInputQuery(accountNo, last_shard), connection, params):
+            yield applyInputSchema(df)
 
 async def redoOutput(tuple_tickets: tuple, start_date: str, end_date: str, connection: oracledb.Connection):
     # Validate date formats
@@ -80,63 +280,274 @@ async def redoOutput(tuple_tickets: tuple, start_date: str, end_date: str, conne
     if not sanitized_tickets:
         # Return empty DataFrame if no valid tickets
         return pd.DataFrame()
-    
-    # Process tickets in chunks of 1000
-    chunk_size = 1000
-    all_results = []
-    
-    for i in range(0, len(sanitized_tickets), chunk_size):
-        chunk = sanitized_tickets[i:i + chunk_size]
-        
-        # Create parameterized query with proper placeholders for IN clause
-        placeholders = ','.join([f':ticket_{j}' for j in range(len(chunk))])
-        
-        query = f"""
-        SELECT t.ticketno AS redotktno ,wh.nickname AS redoloc,t.ACCOUNTNO AS redoacct
-        ,t.ASSIGNDTIME AS redoassigndate
-        , t.completedtime AS redocalccomplete
-        ,to_char(t.COMPLETEDTIME, 'mm/dd/yyyy') AS redocompletedate ,to_char(t.COMPLETEDTIME, 'yyyy_mm') AS redocompletemonth
-        ,t.TECHID , U.FirstName || ' ' || U.LastName AS redotechname
-        FROM opticket t
-        INNER JOIN nspwarehouses wh ON wh.warehouseid = t.warehouseid
-        INNER JOIN opbase b ON b.id = t.id
-        INNER JOIN nspusers u ON t.techid = u.userid
-        WHERE t.COMPLETEDTIME BETWEEN TO_DATE(:start_date, 'YYYY-MM-DD') AND TO_DATE(:end_date, 'YYYY-MM-DD')
-        AND t.vendorid = 1
-        AND t.systemid = 2
-        AND t.servicetype = 'IH'
-        AND t.TICKETNO IN ({placeholders})
-        """
-        
-        # Build parameters dictionary for this chunk
+
+    # Duplicates don't change the IN result, drop them before binding
+    sanitized_tickets = sorted(set(sanitized_tickets))
+
+    # Bind the tickets as one collection so every call shares the same statement text
+    chunk_size = min(settings.redo_ticket_chunk_size, TICKET_LIST_MAX)
+    chunks = [sanitized_tickets[i:i + chunk_size] for i in range(0, len(sanitized_tickets), chunk_size)]
+
+    def _read(chunk, conn):
+        ticket_ids = conn.gettype(TICKET_LIST_TYPE).newobject(chunk)
         params = {
             'start_date': start_date,
-            'end_date': end_date
+            'end_date': end_date,
+            'ticket_ids': ticket_ids
         }
-        
-        # Add ticket parameters for this chunk
-        for j, ticket in enumerate(chunk):
-            params[f'ticket_{j}'] = ticket
-        
-        # Execute query for this chunk in thread pool
-        chunk_df = await asyncio.to_thread(pd.read_sql, query, con=connection, params=params)
-        if not chunk_df.empty:
-            all_results.append(chunk_df)
-    
+        return readSql(REDO_OUTPUT_QUERY, conn, params)
+
+    # First chunk uses the request's connection, the rest run concurrently on pooled connections
+    all_results = await gatherPooled(_read, [(chunk,) for chunk in chunks], connection)
+    all_results = [chunk_df for chunk_df in all_results if not chunk_df.empty]
+
     # Combine all results
     if not all_results:
         return pd.DataFrame()
-    
+
     return pd.concat(all_results, ignore_index=True)
 
+async def redoServerSide(start_date: str, end_date: str, accountNo: list, lookback_days: int, connection: oracledb.Connection):
+    """Compute the redo pairing in Oracle and return the merged redo output in one round trip.
+    Mirrors redoInput -> mainFilter -> processData -> redoOutput -> mergeWithRedo."""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    accountNoQuery = redoAccount(accountNo)
+
+    query = """
+    WITH filtered_tickets AS (
+        SELECT t.* 
+        FROM opticket t
+        WHERE t.COMPLETEDTIME BETWEEN TO_DATE(:start_date, 'YYYY-MM-DD') 
+            AND TO_DATE(:end_date, 'YYYY-MM-DD')
+        AND t.vendorid = 1
+        AND t.systemid = 2
+        AND t.servicetype = 'IH'
+    """ + accountNoQuery + """
+    ),
+    base AS (
+        SELECT 
+            t.ticketno,
+            wh.nickname,
+            t.ACCOUNTNO,
+            t.buildername,
+            t.PRODUCTTYPE,
+            t.SERVICETYPE,
+            t.modelno,
+            t.SERIALNO,
+            b.UPDATEDBY,
+            CASE t.vendorid 
+                WHEN 0 THEN 'Unknown'
+                WHEN 1 THEN 'GSPN'
+            END as VendorID,
+            t.WARRANTYSTATUS,
+            TRUNC(t.ASSIGNDTIME) AS assigndate,
+            TO_CHAR(t.APTSTARTDTIME, 'YYYY-MM-DD') AS apptdate,
+            TO_CHAR(t.issuedtime, 'YYYY-MM-DD') AS Opendate,
+            TRUNC(t.COMPLETEDTIME) AS completedate,
+            TO_CHAR(t.COMPLETEDTIME, 'YYYY_MM') AS completemonth,
+            b.status,
+            t.BRAND,
+            t.TECHID,
+            U.FirstName || ' ' || U.LastName AS TechName,
+            TO_NUMBER(TO_CHAR(t.COMPLETEDTIME, 'IW')) AS week,
+            t.ASSIGNDTIME,
+            t.COMPLETEDTIME
+        FROM filtered_tickets t
+        INNER JOIN nspwarehouses wh ON wh.warehouseid = t.warehouseid
+        INNER JOIN opbase b ON b.id = t.id
+        INNER JOIN nspusers u ON t.techid = u.userid
+        WHERE t.WARRANTYSTATUS IN ('IW', 'YES', 'POP')
+        AND b.status = 60
+    ),
+    paired AS (
+        SELECT 
+            base.*,
+            CASE WHEN serialno IS NOT NULL THEN
+                LAG(ticketno) OVER (PARTITION BY serialno ORDER BY ticketno)
+            END AS redo_check,
+            FIRST_VALUE(assigndate) OVER (PARTITION BY serialno ORDER BY ticketno DESC NULLS LAST) AS check_date
+        FROM base
+    ),
+    flagged AS (
+        SELECT 
+            paired.*,
+            MAX(CASE WHEN completedate >= check_date - :lookback_days AND completedate < check_date THEN 1 ELSE 0 END)
+                OVER (PARTITION BY serialno) AS has_redo
+        FROM paired
+    )
+    SELECT 
+        f.ticketno,
+        f.nickname,
+        f.ACCOUNTNO,
+        f.buildername,
+        f.PRODUCTTYPE,
+        f.SERVICETYPE,
+        f.modelno,
+        f.SERIALNO,
+        f.UPDATEDBY,
+        f.VendorID,
+        f.WARRANTYSTATUS,
+        f.assigndate,
+        f.apptdate,
+        f.Opendate,
+        f.completedate,
+        f.completemonth,
+        f.status,
+        f.BRAND,
+        f.TECHID AS techid_x,
+        f.TechName,
+        f.week,
+        r.ticketno AS redotktno,
+        r.nickname AS redoloc,
+        r.ACCOUNTNO AS redoacct,
+        r.ASSIGNDTIME AS redoassigndate,
+        r.COMPLETEDTIME AS redocalccomplete,
+        TO_CHAR(r.COMPLETEDTIME, 'mm/dd/yyyy') AS redocompletedate,
+        TO_CHAR(r.COMPLETEDTIME, 'yyyy_mm') AS redocompletemonth,
+        r.TECHID AS techid_y,
+        r.TechName AS redotechname
+    FROM flagged f
+    LEFT JOIN base r ON f.has_redo = 1 AND r.ticketno = f.redo_check
+    """
+    params = {'start_date': start_date, 'end_date': end_date, 'lookback_days': lookback_days}
+
+    def _read():
+        params.update(redoAccountParams(accountNo, connection))
+        df = readSql(query, connection, params)
+        # Match the column names and dtypes produced by the pandas path
+        df = df.rename(columns={'TECHID_X': 'TECHID_x', 'TECHID_Y': 'TECHID_y'})
+        df['WEEK'] = df['WEEK'].astype('UInt32')
+        return df
+
+    return await asyncio.to_thread(_read)
+
+def dataVersionQuery(accountNo: list):
+    """Data version probe: the number of tickets in the redoInput range and the latest completion
+    among them. Only opticket is read, through the COMPLETEDTIME index."""
+    return """
+    SELECT MAX(t.COMPLETEDTIME) AS max_completed, COUNT(*) AS tickets
+    FROM opticket t
+    WHERE t.COMPLETEDTIME BETWEEN TO_DATE(:start_date, 'YYYY-MM-DD') AND TO_DATE(:end_date, 'YYYY-MM-DD')
+    AND t.vendorid = 1
+    AND t.systemid = 2
+    AND t.servicetype = 'IH'
+    """ + redoAccount(accountNo)
+
+async def dataVersion(start_date: str, end_date: str, accountNo: list, connection: oracledb.Connection):
+    """(latest COMPLETEDTIME, ticket count) of the tickets a report over the range reads. A ticket
+    that is added to or completed again in the range changes one of them."""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        raise ValueError(f"Invalid date format. Expected YYYY-MM-DD, got start: {start_date}, end: {end_date}")
+
+    def _read():
+        params = {'start_date': start_date, 'end_date': end_date}
+        params.update(redoAccountParams(accountNo, connection))
+        row = readSql(dataVersionQuery(accountNo), connection, params).iloc[0]
+        latest = None if pd.isna(row['MAX_COMPLETED']) else str(row['MAX_COMPLETED'])
+        return latest, int(row['TICKETS'])
+
+    return await asyncio.to_thread(_read)
+
 def redoAccount(accountNo: list):
+    """Account filter for filtered_tickets. The account numbers are bound as one collection
+    (see redoAccountParams) so the statement text doesn't change with the customer list."""
+    if len(accountNo) == 0:
+        return ""
+    return "AND t.accountno IN (SELECT column_value FROM TABLE(:account_nos))"
+
+def redoAccountParams(accountNo: list, connection: oracledb.Connection):
+    """Bind parameters for the filter returned by redoAccount"""
+    if len(accountNo) == 0:
+        return {}
+    if len(accountNo) > ACCOUNT_LIST_MAX:
+        raise ValueError(f"Too many account numbers: {len(accountNo)}, at most {ACCOUNT_LIST_MAX}")
+    account_nos = connection.gettype(ACCOUNT_LIST_TYPE).newobject([str(x) for x in accountNo])
+    return {'account_nos': account_nos}
+
+def _countStatement(query: str):
+    with _statement_lock:
+        if query in _statement_counts:
+            _statement_counts[query] += 1
+            _statement_stats['hits'] += 1
+        else:
+            _statement_counts[query] = 1
+            _statement_stats['misses'] += 1
+
+def _iterRows(query: str, connection: oracledb.Connection, params: dict, batch_rows: int = None):
+    """Column names, then lists of at most batch_rows rows. The cursor fetches arraysize rows per
+    round trip and returns the first prefetchrows rows with the execute round trip."""
+    _countStatement(query)
+    with connection.cursor() as cursor:
+        cursor.arraysize = batch_rows or settings.db_fetch_arraysize
+        cursor.prefetchrows = settings.db_prefetch_rows
+        cursor.execute(query, params)
+        fetched = 0
+        try:
+            yield [column[0] for column in cursor.description]
+            while rows := cursor.fetchmany():
+                fetched += len(rows)
+                yield rows
+        finally:
+            # The execute round trip returns the first prefetchrows rows, each arraysize rows after them is one more
+            countRoundTrips(1 + max(0, -(-(fetched - cursor.prefetchrows) // cursor.arraysize)), fetched)
 
-    if len(accountNo) == 1:
-        accountNoConverted = accountNo[0]
-        query = f"AND accountno = '{accountNoConverted}'"
-    elif len(accountNo) ==0:
-        query = ""
-    else:
-        accountNoConverted = tuple(accountNo)
-        query = f"AND accountno IN {accountNoConverted}"
-    return query
\ No newline at end of file
+def iterSql(query: str, connection: oracledb.Connection, params: dict, batch_rows: int = None):
+    """DataFrames of the query result, one per fetched batch. The frames have the same columns and
+    dtypes pd.read_sql would give; an empty result yields one empty frame with the columns."""
+    batches = _iterRows(query, connection, params, batch_rows)
+    columns = next(batches)
+    empty = True
+    for rows in batches:
+        empty = False
+        yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    if empty:
+        yield pd.DataFrame(columns=columns)
+
+def iterArrow(query: str, connection: oracledb.Connection, params: dict, batch_rows: int = None):
+    """pyarrow RecordBatches of the query result, one per fetched batch, built straight from the
+    fetched columns without an intermediate DataFrame"""
+    import pyarrow as pa
+
+    batches = _iterRows(query, connection, params, batch_rows)
+    columns = next(batches)
+    empty = True
+    for rows in batches:
+        empty = False
+        yield pa.RecordBatch.from_arrays([pa.array(values) for values in zip(*rows)], names=columns)
+    if empty:
+        yield pa.RecordBatch.from_arrays([pa.array([], pa.null()) for _ in columns], names=columns)
+
+async def streamSql(query: str, connection: oracledb.Connection, params: dict, batch_rows: int = None):
+    """Async iterator over iterSql that reads one batch ahead: the fetch of the next batch starts in
+    a thread before the current one is handed to the consumer, so the round trips overlap with the
+    consumer's work. At most two batches are in memory."""
+    batches = iterSql(query, connection, params, batch_rows)
+    fetch = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+    try:
+        # Shielded so a cancelled consumer doesn't leave the thread fetching from a closed generator
+        while (df := await asyncio.shield(fetch)) is not None:
+            fetch = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+            yield df
+    finally:
+        # The generator can only be closed once the read-ahead is done with it
+        await asyncio.wait([fetch])
+        fetch.exception()
+        await asyncio.to_thread(batches.close)
+
+def readSql(query: str, connection: oracledb.Connection, params: dict, transform=None):
+    """Query result as one DataFrame, fetched in batches with the cursor tuning from Settings.
+    transform is applied to each batch before the batches are concatenated, so wide object
+    columns only exist for one batch at a time. Also counts executions per statement text."""
+    return concatInput([transform(df) if transform else df for df in iterSql(query, connection, params)])
+
+def getStatementStats():
+    """Statement reuse counters. A hit is an execution of a statement text that was
+    already executed before, so it can be served from the statement cache."""
+    with _statement_lock:
+        return {
+            'distinct_statements': len(_statement_counts),
+            'hits': _statement_stats['hits'],
+            'misses': _statement_stats['misses'],
+        }
@@ -0,0 +1,76 @@
+import pandas as pd
+
+# Extraction schema of the redoInput columns. Text columns repeat a small set of values
+# across the range and are stored as categoricals, numbers are downcast to the smallest
+# integer type that holds them and the dates used by the pipeline are parsed once at fetch.
+CATEGORY_COLUMNS = (
+    "NICKNAME", "ACCOUNTNO", "BUILDERNAME", "PRODUCTTYPE", "SERVICETYPE", "MODELNO", "UPDATEDBY",
+    "VENDORID", "WARRANTYSTATUS", "APPTDATE", "OPENDATE", "COMPLETEMONTH", "BRAND", "TECHNAME",
+)
+# SERIALNO is only downcast when the database returns it as a number, text serials are kept as they are
+INTEGER_COLUMNS = ("TICKETNO", "SERIALNO", "STATUS", "TECHID")
+DATE_COLUMNS = ("ASSIGNDATE", "COMPLETEDATE")
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def _downcast(series):
+    if not pd.api.types.is_integer_dtype(series) or series.empty:
+        return series
+    downcast = "unsigned" if series.min() >= 0 else "integer"
+    return pd.to_numeric(series, downcast=downcast)
+
+
+def applyInputSchema(df):
+    """Convert a redoInput frame to the extraction schema in place and return it.
+    Columns that already have their schema type are left untouched, so applying it twice is cheap."""
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = _downcast(df[column])
+    for column in DATE_COLUMNS:
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+    return df
+
+
+def _alignNullBatches(frames, column):
+    # A fetched batch where a column is all NULL gets an object column. Give it the type the
+    # column has in the other batches, like a single read of the whole result would.
+    nulls = [df for df in frames if column in df.columns and df[column].dtype == object and df[column].isna().all()]
+    dtypes = {df[column].dtype for df in frames if column in df.columns and not any(df is null for null in nulls)}
+    if not nulls or len(dtypes) != 1:
+        return
+    dtype = dtypes.pop()
+    if pd.api.types.is_integer_dtype(dtype):
+        dtype = "float64"
+    elif not (pd.api.types.is_float_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)):
+        return
+    for df in nulls:
+        df[column] = df[column].astype(dtype)
+
+
+def concatInput(frames):
+    """pd.concat for schema frames. Categoricals with different categories would fall back to
+    object columns, so every frame is recoded to the union of the categories first."""
+    frames = [df for df in frames if len(df.columns)]
+    if any(len(df) for df in frames):
+        # Empty shards carry no categories and would turn the categoricals back into object columns
+        frames = [df for df in frames if len(df)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    # Frames may be shared with the cache, recode shallow copies instead of the frames themselves
+    frames = [df.copy(deep=False) for df in frames]
+    for column in frames[0].columns:
+        _alignNullBatches(frames, column)
+        if not all(isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames if column in df.columns):
+            continue
+        categories = pd.api.types.union_categoricals([df[column] for df in frames if column in df.columns]).categories
+        for df in frames:
+            if column in df.columns:
+                df[column] = df[column].cat.set_categories(categories)
+    # Integer columns downcast per frame can differ in width, the concat upcasts to the widest
+    return pd.concat(frames, ignore_index=True)
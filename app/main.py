@@ -1,11 +1,45 @@
-from fastapi import FastAPI, Security, HTTPException, Depends
+from fastapi import FastAPI, Security, HTTPException, Depends, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.security import APIKeyHeader
 from fastapi.openapi.utils import get_openapi
-from app.routers import redo
+from contextlib import asynccontextmanager
+from app.routers import redo, batch, kpi, rows, jobs, admin
 from app.core.config import settings
+from app.core.logs import setupLogging, stopLogging, getLogStats, requestId
+from app.db.connection import createPool, closePool, getPoolStats
+from app.db.queries import getStatementStats
+from app.utils.jobs import startJobWorkers, stopJobWorkers
+from app.utils.cache import loadDiskCache
+from app.db.index import initIndex, startIndexSync, stopIndexSync, getIndexStats
+from app.utils.executor import startProcessPool, stopProcessPool
+from app.utils.metrics import requestTimings, serverTiming, renderMetrics
+from app.utils.admission import getAdmissionStats
+from app.utils.cache import getCacheStats
+import asyncio
+import uuid
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setupLogging()
+    # Open and warm the connection pool before serving requests
+    await asyncio.to_thread(createPool)
+    if settings.cache_enabled:
+        await asyncio.to_thread(loadDiskCache)
+    if settings.index_enabled:
+        await asyncio.to_thread(initIndex)
+        startIndexSync()
+    await asyncio.to_thread(startProcessPool)
+    startJobWorkers()
+    yield
+    await stopJobWorkers()
+    await stopIndexSync()
+    await asyncio.to_thread(stopProcessPool)
+    await asyncio.to_thread(closePool)
+    stopLogging()
 
 # Initialize the app
 app = FastAPI(
+    lifespan=lifespan,
     title="KW AIRO Redo API",
     description= """
     API for generating an Excel spreadsheet with information about redo tickets within a date range for Service Quick.
@@ -35,11 +69,58 @@ async def verifyApiKey(api_key: str = Security(api_key_header)):
         )
     return api_key
 
+@app.middleware("http")
+async def requestIdHeader(request: Request, call_next):
+    """Tag the records logged for a request with its X-Request-ID, or a new id, and return the id"""
+    request_id = (request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])[:64]
+    token = requestId.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        requestId.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def serverTimingHeader(request: Request, call_next):
+    """Collect the stage durations of a request into a Server-Timing header when enabled"""
+    if not settings.server_timing:
+        return await call_next(request)
+    timings = []
+    token = requestTimings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        requestTimings.reset(token)
+    if timings:
+        response.headers["Server-Timing"] = serverTiming(timings)
+    return response
+
 # Add routers to the app
 app.include_router(
     redo.router,
     dependencies=[Depends(verifyApiKey)]
 ) 
+app.include_router(
+    batch.router,
+    dependencies=[Depends(verifyApiKey)]
+)
+app.include_router(
+    kpi.router,
+    dependencies=[Depends(verifyApiKey)]
+)
+app.include_router(
+    rows.router,
+    dependencies=[Depends(verifyApiKey)]
+)
+app.include_router(
+    jobs.router,
+    dependencies=[Depends(verifyApiKey)]
+)
+app.include_router(
+    admin.router,
+    dependencies=[Depends(verifyApiKey)]
+)
 
 # Root endpoint
 @app.get("/", 
@@ -69,6 +150,68 @@ app.include_router(
 def readRoot():
     return {"message": "Welcome to AIRO's KPI app"}
 
+# Connection pool statistics
+@app.get("/pool",
+    dependencies=[Depends(verifyApiKey)],
+    summary="Connection pool statistics",
+    description="Returns the current state of the database connection pool, statement reuse counters and the sync state of the local index for monitoring.",
+    response_description="Connection pool statistics",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "status": "open", "opened": 2, "busy": 0, "min": 2, "max": 10,
+                        "statements": {"distinct_statements": 3, "hits": 120, "misses": 3},
+                        "index": {"status": "disabled"}
+                    }
+                }
+            }
+        }
+    }
+)
+def poolStats():
+    return {**getPoolStats(), "statements": getStatementStats(), "index": getIndexStats()}
+
+# Prometheus metrics
+@app.get("/metrics",
+    dependencies=[Depends(verifyApiKey)],
+    summary="Prometheus metrics",
+    description="Returns per-stage latency histograms, row and byte counters, database round trips and in-flight gauges in the Prometheus text format.",
+    response_class=PlainTextResponse,
+    response_description="Metrics in the Prometheus text exposition format",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "text/plain": {
+                    "example": 'redo_stage_seconds_bucket{stage="redoInput",le="0.5"} 12'
+                }
+            }
+        }
+    }
+)
+def metrics():
+    pool = getPoolStats()
+    admission = getAdmissionStats()
+    cache = getCacheStats()
+    logs = getLogStats()
+    gauges = {
+        "redo_db_pool_opened": ("Open connections of the database pool", pool.get("opened", 0)),
+        "redo_db_pool_busy": ("Connections of the database pool in use", pool.get("busy", 0)),
+        "redo_admission_active": ("Requests holding a slot of an admission stage",
+            {(("stage", name),): stats["active"] for name, stats in admission.items()}),
+        "redo_admission_queued": ("Requests waiting for a slot of an admission stage",
+            {(("stage", name),): stats["queued"] for name, stats in admission.items()}),
+        "redo_cache_hits": ("Result cache hits since startup",
+            {(("tier", "memory"),): cache["memory_hits"], (("tier", "disk"),): cache["disk_hits"]}),
+        "redo_cache_misses": ("Result cache misses since startup", cache["misses"]),
+        "redo_log_queued": ("Log records waiting for the writer thread", logs["queued"]),
+        "redo_log_dropped": ("Log records dropped since startup because the log queue was full", logs["dropped"]),
+    }
+    return PlainTextResponse(renderMetrics(gauges), media_type="text/plain; version=0.0.4")
+
 # Custom OpenAPI schema 
 def customOpenapi(): 
     if app.openapi_schema: 
@@ -0,0 +1,143 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.db.queries import partitionMatches
+from app.utils.cache import invalidate, getCacheStats
+from app.utils.singleflight import getSingleFlightStats
+from app.utils.admission import getAdmissionStats
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    responses={
+        410: {
+            "description": "Invalid API key",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid API key"}
+                }
+            }
+        }
+    }
+)
+
+
+@router.get("/cache",
+    summary="Result cache statistics",
+    description="Returns hit/miss counters and the size of the memory and disk tiers of the result cache.",
+    response_description="Result cache statistics",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "memory_hits": 42, "disk_hits": 3, "misses": 12, "memory_evictions": 0,
+                        "disk_evictions": 0, "invalidations": 0, "hit_ratio": 0.79,
+                        "memory_entries": 12, "memory_bytes": 104857600, "disk_entries": 12, "disk_bytes": 20971520
+                    }
+                }
+            }
+        }
+    }
+)
+async def cacheStats():
+    return getCacheStats()
+
+
+@router.delete("/cache",
+    summary="Invalidate the result cache",
+    description="""
+    Drops cached partitions. Without parameters the whole cache is cleared.
+    `month` (YYYY-MM) and `accountNo` narrow it down to the partitions covering that month and/or account.
+    """,
+    response_description="Number of partitions dropped",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {"invalidated": 4}
+                }
+            }
+        },
+        422: {
+            "description": "Invalid month",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid month format. Expected YYYY-MM"}
+                }
+            }
+        }
+    }
+)
+async def invalidateCache(
+    month: Optional[str] = Query(None, description="Month to invalidate in YYYY-MM format", example="2024-01"),
+    accountNo: Optional[str] = Query(None, description="Account number to invalidate", example="1234567890")
+):
+    if month and not re.match(r'^\d{4}-\d{2}$', month):
+        raise HTTPException(status_code=422, detail="Invalid month format. Expected YYYY-MM")
+
+    if month or accountNo:
+        invalidated = invalidate(lambda key: partitionMatches(key, month, accountNo))
+    else:
+        invalidated = invalidate()
+    logger.info("Invalidated %s cache partitions (month: %s, account: %s)", invalidated, month, accountNo)
+    return {"invalidated": invalidated}
+
+
+@router.get("/singleflight",
+    summary="Request coalescing statistics",
+    description="""
+    Returns per request key how often it was called, how many runs actually executed,
+    how many calls joined a run already in flight and how many runs failed.
+    """,
+    response_description="Request coalescing statistics",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "in_flight": 1,
+                        "keys": {
+                            "2024-01-01|2024-01-31|1234567890|90|pandas": {
+                                "calls": 5, "executions": 1, "shared": 4, "errors": 0, "in_flight": True
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+)
+async def singleFlightStats():
+    return getSingleFlightStats()
+
+
+@router.get("/admission",
+    summary="Admission control statistics",
+    description="Returns the concurrency limit, active slots, queue depth and wait times of the db, cpu and excel stages.",
+    response_description="Admission control statistics",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "db": {
+                            "limit": 8, "active": 8, "queued": 3, "max_queue": 20, "admitted": 120,
+                            "rejected": 2, "avg_wait_seconds": 0.8, "max_wait_seconds": 12.5
+                        }
+                    }
+                }
+            }
+        }
+    }
+)
+async def admissionStats():
+    return getAdmissionStats()
@@ -0,0 +1,328 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Literal, List
+from datetime import date
+import asyncio
+import logging
+import re
+import tempfile
+from app.db.connection import getConnection
+from app.db.queries import redoInput, redoOutput, emptyRedoOutput
+from app.db.index import indexReady, indexInput, indexOutput
+from app.core.config import settings
+from app.routers.redo import redoResponses
+from app.utils.process import validateDateFormat, mainFilter, processSlices, mergeWithRedo, iterFile
+from app.utils.admission import stage, requestPriority, AdmissionRejected
+from app.utils.export import writeArchive, outputExtension
+from app.utils.metrics import timed, inFlight, countBytes
+
+logger = logging.getLogger(__name__)
+
+ZIP_MEDIA_TYPE = "application/zip"
+
+
+router = APIRouter(
+    prefix="/redo",
+    tags=["redo"],
+    responses={
+        410: {
+            "description": "Invalid API key",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid API key"}
+                }
+            }
+        }
+    }
+)
+
+class RedoBatchSpec(BaseModel):
+    name: Optional[str] = Field(
+        None,
+        description="Name of the spec's file in the archive. Defaults to spec-1, spec-2, ... in the order of the specs.",
+        example="dallas"
+    )
+    accountNo: list = Field(
+        ...,
+        description="Account numbers of this spec. An empty list selects every account.",
+        example=["1234567890", "0987654321"]
+    )
+    startDate: Optional[str] = Field(
+        None,
+        description="Start of a sub-range of the batch date range, YYYY-MM-DD. Defaults to the batch start date.",
+        example="2024-02-01"
+    )
+    endDate: Optional[str] = Field(
+        None,
+        description="End of a sub-range of the batch date range, YYYY-MM-DD. Defaults to the batch end date. A sub-range that ends before the batch end date leaves its end date out.",
+        example="2024-03-01"
+    )
+
+
+class RedoBatchInput(BaseModel):
+    startDate: str = Field(
+        ...,
+        description="Start date of the date range all specs are extracted from. Must be in YYYY-MM-DD format.",
+        example="2024-01-15"
+    )
+    endDate: str = Field(
+        ...,
+        description="End date of the date range all specs are extracted from. Must be in YYYY-MM-DD format.",
+        example="2024-03-31"
+    )
+    specs: List[RedoBatchSpec] = Field(
+        ...,
+        min_length=1,
+        description="Account groups to produce an output for. Each output is the same as /redo/single for the spec's accounts and date range."
+    )
+    lookbackDays: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Number of days before a ticket's assign date in which a completed ticket counts as a redo. Defaults to the server setting (90 days).",
+        example=90
+    )
+    mode: Optional[Literal["pandas", "index"]] = Field(
+        None,
+        description="Where the tickets are read from: 'pandas' queries the database, 'index' reads the local ticket index. Defaults to the server setting, 'sql' falls back to 'pandas'.",
+        example="pandas"
+    )
+    format: Optional[Literal["xlsx", "csv", "parquet", "ndjson"]] = Field(
+        None,
+        description="Format of the files in the archive. Defaults to 'xlsx'.",
+        example="xlsx"
+    )
+
+
+def _parseRange(start_date: str, end_date: str):
+    """(start, end) dates, or None when they aren't a valid YYYY-MM-DD range"""
+    if not validateDateFormat(start_date) or not validateDateFormat(end_date):
+        return None
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        return None
+    return (start, end) if start <= end else None
+
+
+def _filenames(specs: list, output_format: str):
+    """Unique archive file names from the spec names"""
+    filenames = []
+    for number, spec in enumerate(specs, start=1):
+        name = re.sub(r"[^A-Za-z0-9._-]+", "_", spec.name or "").strip("._") or f"spec-{number}"
+        filename = f"{name}.{outputExtension(output_format)}"
+        if filename in filenames:
+            filename = f"{name}-{number}.{outputExtension(output_format)}"
+        filenames.append(filename)
+    return filenames
+
+
+def unionAccounts(specs: list):
+    """Account numbers covering every spec, an empty list when a spec asks for every account"""
+    if any(len(spec.accountNo) == 0 for spec in specs):
+        return []
+    return sorted({str(x) for spec in specs for x in spec.accountNo})
+
+
+async def _runBatchStages(request: RedoBatchInput, ranges: list, priority: int):
+    """Extract the tickets of every spec in one read over the batch range and return the merged
+    output frame of each spec. The redo pairing runs per spec, so a serial seen by two account
+    groups doesn't pair tickets across them, and the redo tickets of all specs are looked up in one query."""
+    mode = request.mode or settings.redo_mode
+    if mode == "index" and not await asyncio.to_thread(indexReady):
+        logger.warning("Local index is not ready, falling back to pandas mode")
+        mode = "pandas"
+    elif mode == "sql":
+        mode = "pandas"
+
+    connection = None
+    try:
+        if mode != "index":
+            try:
+                async with timed("connect"):
+                    connection = await asyncio.to_thread(getConnection)
+            except Exception as e:
+                logger.error("Error connecting to database: %s", e)
+                raise HTTPException(status_code=500, detail="Error connecting to database")
+
+        accounts = unionAccounts(request.specs)
+        try:
+            logger.info("Retrieving ticket list for %s specs, %s to %s", len(request.specs), request.startDate, request.endDate)
+            async with timed("indexInput" if mode == "index" else "redoInput") as span:
+                if mode == "index":
+                    df = await indexInput(request.startDate, request.endDate, accounts)
+                else:
+                    df = await redoInput(request.startDate, request.endDate, accounts, connection)
+                span.rows = len(df)
+        except Exception as e:
+            logger.error("Error retrieving ticket list: %s", e)
+            raise HTTPException(status_code=401, detail="Error retrieving data from database")
+
+        try:
+            async with stage("cpu", priority), timed("mainFilter") as span:
+                df = await mainFilter(df)
+                span.rows = len(df)
+        except Exception as e:
+            logger.error("Error filtering data: %s", e)
+            raise HTTPException(status_code=402, detail="Error filtering data")
+
+        slices = [
+            (spec.accountNo, start_date, end_date, end_date == request.endDate)
+            for spec, (start_date, end_date) in zip(request.specs, ranges)
+        ]
+        try:
+            async with stage("cpu", priority), timed("processData") as span:
+                frames = await processSlices(df, slices, request.lookbackDays)
+                span.rows = sum(len(frame) for frame in frames)
+            del df
+        except Exception as e:
+            logger.error("Error processing data: %s", e)
+            raise HTTPException(status_code=403, detail="Error processing data")
+
+        try:
+            tickets = set()
+            for frame in frames:
+                tickets.update(frame['REDO_CHECK'].dropna().astype(int))
+            if tickets:
+                async with timed("indexOutput" if mode == "index" else "redoOutput") as span:
+                    redo_tupe = tuple(f'{x}' for x in sorted(tickets))
+                    if mode == "index":
+                        output = await indexOutput(redo_tupe, request.startDate, request.endDate)
+                    else:
+                        output = await redoOutput(redo_tupe, request.startDate, request.endDate, connection)
+                    span.rows = len(output)
+            else:
+                output = emptyRedoOutput()
+            if output.empty:
+                output = emptyRedoOutput()
+        except Exception as e:
+            logger.error("Error compiling redo data: %s", e)
+            raise HTTPException(status_code=406, detail="Error compiling redo data")
+    finally:
+        if connection:
+            await asyncio.to_thread(connection.close)
+
+    outputs = []
+    try:
+        for frame in frames:
+            async with stage("cpu", priority), timed("mergeWithRedo") as span:
+                redo_output_df = await mergeWithRedo(frame, output)
+                span.rows = len(redo_output_df)
+            redo_output_df.drop('REDO_CHECK', axis=1, inplace=True)
+            outputs.append(redo_output_df)
+    except Exception as e:
+        logger.error("Error merging data: %s", e)
+        raise HTTPException(status_code=407, detail="Error merging data")
+
+    logger.info("Processed batch of %s specs with %s redo tickets", len(outputs), len(tickets))
+    return outputs
+
+
+@router.post("/batch",
+    summary="Process many account groups over one date range",
+    description="""
+    Produces the `/redo/single` output for many account groups at once, for schedulers that
+    would otherwise call `/redo/single` once per group over the same date range.
+
+    The tickets of all specs are read from the database in one extraction over the batch date
+    range and the union of the account numbers, filtered once, paired per spec and looked up in
+    one `redoOutput` query. Each spec can narrow the range to a sub-range.
+
+    Returns a zip archive with one file per spec in `format` and a `manifest.json` listing the
+    file, accounts, date range and row counts of every spec.
+    """,
+    response_class=StreamingResponse,
+    response_description="Zip archive with one output file per spec",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                ZIP_MEDIA_TYPE: {}
+            }
+        },
+        410: {
+            "description": "Error writing the archive",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Error writing the archive"}
+                }
+            }
+        },
+        422: {
+            "description": "Invalid batch",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Spec 2 is not a date range within the batch date range"}
+                }
+            }
+        },
+        **redoResponses
+    }
+)
+async def batchRedo(request: RedoBatchInput):
+    if len(request.specs) > settings.batch_max_specs:
+        raise HTTPException(status_code=422, detail=f"At most {settings.batch_max_specs} specs per batch")
+    batch_range = _parseRange(request.startDate, request.endDate)
+    if batch_range is None:
+        raise HTTPException(status_code=422, detail="Invalid batch date range")
+    ranges = []
+    for number, spec in enumerate(request.specs, start=1):
+        spec_range = (spec.startDate or request.startDate, spec.endDate or request.endDate)
+        parsed = _parseRange(*spec_range)
+        if parsed is None or parsed[0] < batch_range[0] or parsed[1] > batch_range[1]:
+            raise HTTPException(status_code=422, detail=f"Spec {number} is not a date range within the batch date range")
+        ranges.append(spec_range)
+
+    priority = requestPriority(request.startDate, request.endDate)
+    try:
+        async with stage("db", priority, reject=True), inFlight():
+            outputs = await _runBatchStages(request, ranges, priority)
+    except AdmissionRejected as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+
+    output_format = request.format or "xlsx"
+    filenames = _filenames(request.specs, output_format)
+    manifest = {
+        "startDate": request.startDate,
+        "endDate": request.endDate,
+        "files": [
+            {
+                "filename": filename,
+                "accountNo": [str(x) for x in spec.accountNo],
+                "startDate": start_date,
+                "endDate": end_date,
+                "rows": len(df),
+                "redoRows": int(df['REDOTKTNO'].notna().sum()),
+            }
+            for filename, spec, (start_date, end_date), df in zip(filenames, request.specs, ranges, outputs)
+        ],
+    }
+
+    def _write():
+        file = tempfile.SpooledTemporaryFile(max_size=settings.excel_spool_max_size)
+        try:
+            writeArchive(file, zip(filenames, outputs), output_format, manifest)
+            size = file.tell()
+            file.seek(0)
+        except Exception:
+            file.close()
+            raise
+        return file, size
+
+    try:
+        async with stage("excel", priority), timed("writeBatch"):
+            file, size = await asyncio.to_thread(_write)
+        countBytes("zip", size)
+    except Exception as e:
+        logger.error("Error writing the archive: %s", e)
+        raise HTTPException(status_code=410, detail="Error writing the archive")
+
+    return StreamingResponse(
+        iterFile(file),
+        media_type=ZIP_MEDIA_TYPE,
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": 'attachment; filename="redo_batch.zip"'
+        }
+    )
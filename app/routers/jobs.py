@@ -0,0 +1,189 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from app.routers.redo import RedoInput, runRedoPipeline, XLSX_MEDIA_TYPE
+from app.utils.excel import writeExcel
+from app.utils.export import iterExport, exportMediaType, exportFilename
+from app.utils.admission import stage, requestPriority, rejectWhenFull
+from app.utils.jobs import submitJob, getJob, getJobStatus, cancelJob, JobQueueFull, DONE
+from app.utils.metrics import timed, countBytes
+import logging
+import asyncio
+import os
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(
+    prefix="/redo/jobs",
+    tags=["redo jobs"],
+    responses={
+        410: {
+            "description": "Invalid API key",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid API key"}
+                }
+            }
+        }
+    }
+)
+
+jobStatusExample = {
+    "jobId": "3f2b6c1e9a7d4e0f8b5a2c6d1e9f0a7b",
+    "status": "running",
+    "created": 1705312800.0,
+    "started": 1705312801.2,
+    "finished": None,
+    "error": None
+}
+
+jobNotFound = {
+    "description": "Job not found",
+    "content": {
+        "application/json": {
+            "example": {"detail": "Job not found"}
+        }
+    }
+}
+
+
+def _redoJob(request: RedoInput):
+    """Job that runs the redo pipeline and writes the output in the requested format"""
+    output_format = request.format or "xlsx"
+
+    async def _run(path):
+        # Jobs already waited in the job queue, they wait for a stage slot instead of being rejected
+        rejectWhenFull.set(False)
+        redo_output_df = await runRedoPipeline(request)
+
+        def _write():
+            with open(path, "wb") as file:
+                if output_format == "xlsx":
+                    writeExcel(redo_output_df, file)
+                else:
+                    for chunk in iterExport(redo_output_df, output_format, request.compression):
+                        file.write(chunk)
+
+        async with stage("excel", requestPriority(request.startDate, request.endDate)), timed("writeJob"):
+            await asyncio.to_thread(_write)
+        countBytes(output_format, os.path.getsize(path))
+        if output_format == "xlsx":
+            return "redo_output.xlsx", XLSX_MEDIA_TYPE
+        return exportFilename(output_format, request.compression), exportMediaType(output_format, request.compression)
+
+    return _run
+
+
+@router.post("",
+    status_code=202,
+    summary="Submit a redo job",
+    description="""
+    Queues the same processing as `/redo/single` to run in the background and returns a job id right away.
+    Poll `/redo/jobs/{jobId}` for the status and fetch the result from `/redo/jobs/{jobId}/download`.
+    The result is written in `format` (xlsx by default) and kept until it expires.
+    """,
+    response_description="Status of the queued job",
+    responses={
+        202: {
+            "description": "Job queued",
+            "content": {
+                "application/json": {
+                    "example": {**jobStatusExample, "status": "queued", "started": None}
+                }
+            }
+        },
+        503: {
+            "description": "Job queue is full",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Job queue is full"}
+                }
+            }
+        }
+    }
+)
+async def submitRedoJob(request: RedoInput):
+    try:
+        status = submitJob(_redoJob(request))
+    except JobQueueFull as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=503, detail="Job queue is full")
+    logger.info("Queued job %s for date range %s to %s", status['jobId'], request.startDate, request.endDate)
+    return status
+
+
+@router.get("/{job_id}",
+    summary="Get the status of a redo job",
+    description="Status is one of `queued`, `running`, `done`, `failed` or `cancelled`. Failed jobs report the pipeline error.",
+    response_description="Status of the job",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": jobStatusExample
+                }
+            }
+        },
+        404: jobNotFound
+    }
+)
+async def redoJobStatus(job_id: str):
+    status = getJobStatus(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@router.get("/{job_id}/download",
+    summary="Download the result of a redo job",
+    response_class=FileResponse,
+    response_description="Output file of the job",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                XLSX_MEDIA_TYPE: {}
+            }
+        },
+        404: jobNotFound,
+        409: {
+            "description": "Job is not done",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Job is not done"}
+                }
+            }
+        }
+    }
+)
+async def downloadRedoJob(job_id: str):
+    job = getJob(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail="Job is not done")
+    return FileResponse(job["path"], media_type=job["media_type"], filename=job["filename"])
+
+
+@router.delete("/{job_id}",
+    summary="Cancel a redo job",
+    description="Cancels a queued or running job. Finished jobs are not changed.",
+    response_description="Status of the job",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {**jobStatusExample, "status": "cancelled"}
+                }
+            }
+        },
+        404: jobNotFound
+    }
+)
+async def cancelRedoJob(job_id: str):
+    status = cancelJob(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
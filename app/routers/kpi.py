@@ -0,0 +1,184 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional, Literal, List
+import asyncio
+import logging
+from app.db.connection import getConnection
+from app.db.queries import redoInput, redoServerSide
+from app.db.index import indexReady, indexInput
+from app.core.config import settings
+from app.routers.redo import redoResponses, requestKey
+from app.utils.process import mainFilter, processData, redoKpis, KPI_DIMENSIONS
+from app.utils.singleflight import singleFlight
+from app.utils.admission import stage, requestPriority, AdmissionRejected
+from app.utils.metrics import timed, inFlight
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(
+    prefix="/redo",
+    tags=["redo"],
+    responses={
+        410: {
+            "description": "Invalid API key",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid API key"}
+                }
+            }
+        }
+    }
+)
+
+class RedoKpiInput(BaseModel):
+    startDate: str = Field(
+        ...,
+        description="Start date of the date range to retrieve tickets for. Must be in YYYY-MM-DD format.",
+        example="2024-01-01"
+    )
+    endDate: str = Field(
+        ...,
+        description="End date of the date range to retrieve tickets for. Must be in YYYY-MM-DD format.",
+        example="2024-01-31"
+    )
+    accountNo: list = Field(
+        ...,
+        description="List of account numbers to retrieve tickets for. Must be in a list of strings.",
+        example=["1234567890", "0987654321"]
+    )
+    lookbackDays: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Number of days before a ticket's assign date in which a completed ticket counts as a redo. Defaults to the server setting (90 days).",
+        example=90
+    )
+    mode: Optional[Literal["pandas", "sql", "index"]] = Field(
+        None,
+        description="Where the redo pairing is computed, as for /redo/single. Defaults to the server setting.",
+        example="pandas"
+    )
+    dimensions: Optional[List[Literal[tuple(KPI_DIMENSIONS)]]] = Field(
+        None,
+        description="Dimensions to aggregate by: 'tech', 'warehouse' (NICKNAME), 'brand', 'productType', 'month' (COMPLETEMONTH) and 'week' (ISO year and week of COMPLETEDATE). Defaults to all of them.",
+        example=["tech", "warehouse"]
+    )
+
+
+async def _runKpiStages(request: RedoKpiInput, priority: int, dimensions: list):
+    """Redo KPIs of a request. They only need the processData frame: a ticket is a redo when
+    processData pairs it with an earlier ticket, so redoOutput, the merge and the workbook are skipped."""
+    mode = request.mode or settings.redo_mode
+    if mode == "index" and not await asyncio.to_thread(indexReady):
+        logger.warning("Local index is not ready, falling back to pandas mode")
+        mode = "pandas"
+
+    connection = None
+    try:
+        if mode != "index":
+            try:
+                async with timed("connect"):
+                    connection = await asyncio.to_thread(getConnection)
+            except Exception as e:
+                logger.error("Error connecting to database: %s", e)
+                raise HTTPException(status_code=500, detail="Error connecting to database")
+
+        if mode == "sql":
+            try:
+                lookback_days = request.lookbackDays or settings.redo_lookback_days
+                async with timed("redoServerSide") as span:
+                    df = await redoServerSide(request.startDate, request.endDate, request.accountNo, lookback_days, connection)
+                    span.rows = len(df)
+            except Exception as e:
+                logger.error("Error retrieving redo data: %s", e)
+                raise HTTPException(status_code=401, detail="Error retrieving data from database")
+        else:
+            try:
+                async with timed("indexInput" if mode == "index" else "redoInput") as span:
+                    if mode == "index":
+                        df = await indexInput(request.startDate, request.endDate, request.accountNo)
+                    else:
+                        df = await redoInput(request.startDate, request.endDate, request.accountNo, connection)
+                    span.rows = len(df)
+            except Exception as e:
+                logger.error("Error retrieving ticket list: %s", e)
+                raise HTTPException(status_code=401, detail="Error retrieving data from database")
+
+            try:
+                async with stage("cpu", priority), timed("mainFilter") as span:
+                    df = await mainFilter(df)
+                    span.rows = len(df)
+            except Exception as e:
+                logger.error("Error filtering data: %s", e)
+                raise HTTPException(status_code=402, detail="Error filtering data")
+
+            try:
+                async with stage("cpu", priority), timed("processData") as span:
+                    df = await processData(df, request.lookbackDays)
+                    span.rows = len(df)
+            except Exception as e:
+                logger.error("Error processing data: %s", e)
+                raise HTTPException(status_code=403, detail="Error processing data")
+    finally:
+        if connection:
+            await asyncio.to_thread(connection.close)
+
+    try:
+        async with stage("cpu", priority), timed("redoKpis"):
+            return await redoKpis(df, dimensions)
+    except Exception as e:
+        logger.error("Error aggregating data: %s", e)
+        raise HTTPException(status_code=404, detail="Error compiling data")
+
+
+async def _runKpi(request: RedoKpiInput, dimensions: list):
+    priority = requestPriority(request.startDate, request.endDate)
+    try:
+        async with stage("db", priority, reject=True), inFlight():
+            return await _runKpiStages(request, priority, dimensions)
+    except AdmissionRejected as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+
+
+@router.post("/kpi",
+    summary="Redo rates of a date range",
+    description="""
+    Returns the redo count, the number of completed tickets and the redo rate of a date range,
+    overall and per tech, warehouse, brand, product type, month and week, as JSON.
+
+    A ticket counts as a redo when it has a `REDOTKTNO` in the `/redo/single` output, so the numbers
+    are the same as a pivot of the workbook on the ticket's own columns. The aggregates are computed
+    from the redo detection stage, without looking up the redo tickets or writing the workbook.
+    """,
+    response_description="Redo KPIs overall and per dimension",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "startDate": "2024-01-01",
+                        "endDate": "2024-01-31",
+                        "lookbackDays": 90,
+                        "total": {"tickets": 18250, "redos": 912, "redoRate": 0.04997},
+                        "dimensions": {
+                            "tech": [{"key": 101, "name": "JOHN SMITH", "tickets": 240, "redos": 9, "redoRate": 0.0375}],
+                            "warehouse": [{"key": "DALLAS", "tickets": 4100, "redos": 198, "redoRate": 0.04829}]
+                        }
+                    }
+                }
+            }
+        },
+        **redoResponses
+    }
+)
+async def kpiRedo(request: RedoKpiInput):
+    dimensions = list(dict.fromkeys(request.dimensions or KPI_DIMENSIONS))
+    kpis = await singleFlight(f"kpi|{requestKey(request)}|{','.join(dimensions)}", lambda: _runKpi(request, dimensions))
+    return {
+        "startDate": request.startDate,
+        "endDate": request.endDate,
+        "lookbackDays": request.lookbackDays or settings.redo_lookback_days,
+        **kpis,
+    }
@@ -1,27 +1,30 @@
 from app.db.connection import getConnection
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel, Field
+from typing import Optional, Literal
 import pandas as pd
-from app.db.queries import redoInput, redoOutput
-from app.utils.process import mainFilter, processData, mergeWithRedo, getExcelBase64
+from app.db.queries import redoInput, redoOutput, redoServerSide, streamRedoInput, emptyRedoOutput, dataVersion
+from app.db.index import indexReady, indexInput, indexOutput, streamIndexInput, indexVersion
+from app.core.config import settings
+from app.utils.process import mainFilter, processData, mergeWithRedo, getExcelBase64, getExcelFile, iterFile
+from app.utils.singleflight import singleFlight
+from app.utils.admission import stage, requestPriority, AdmissionRejected
+from app.utils.export import formatFromAccept, iterExport, exportMediaType, exportFilename
+from app.utils.partition import PartitionedResult
+from app.utils.metrics import timed, inFlight, iterCounted, countBytes
+from datetime import date
+import hashlib
 import logging
 import warnings
 import asyncio
 warnings.filterwarnings("ignore")
 
 
-
-# Set up file logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('redo.log'),
-        logging.StreamHandler()  # Also print to console
-    ]
-)
 logger = logging.getLogger(__name__)
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
 
 router = APIRouter(
     prefix="/redo", 
@@ -54,6 +57,33 @@ class RedoInput(BaseModel):
         description="List of account numbers to retrieve tickets for. Must be in a list of strings.",
         example=["1234567890", "0987654321"]
     )
+    lookbackDays: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Number of days before a ticket's assign date in which a completed ticket counts as a redo. Defaults to the server setting (90 days).",
+        example=90
+    )
+    mode: Optional[Literal["pandas", "sql", "index"]] = Field(
+        None,
+        description="Where the redo pairing is computed: 'pandas' pulls the tickets and pairs them in the API, 'sql' pairs them in the database in a single query, 'index' pairs them in the API from the local ticket index without querying the database. Defaults to the server setting.",
+        example="pandas"
+    )
+    format: Optional[Literal["xlsx", "csv", "parquet", "ndjson"]] = Field(
+        None,
+        description="Output format of /redo/single. 'xlsx' returns the base64 encoded workbook in JSON, the other formats are streamed. When omitted, the format is taken from the Accept header and defaults to 'xlsx'.",
+        example="xlsx"
+    )
+    compression: Optional[Literal["gzip"]] = Field(
+        None,
+        description="Compress csv and ndjson output with gzip.",
+        example="gzip"
+    )
+    partitions: Optional[int] = Field(
+        None,
+        ge=0,
+        description="Split the tickets into this many partitions by serial number and process them one at a time, so very large date ranges don't have to fit in memory. The output is the same. 0 processes the whole range at once. Defaults to the server setting, which partitions long date ranges. Not used with mode 'sql'.",
+        example=16
+    )
 
     class Config:
         schema_extra = {
@@ -65,6 +95,442 @@ class RedoInput(BaseModel):
         }
 
 
+redoResponses = {
+    401: {
+        "description": "Error retrieving data from database",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error retrieving data from database"}
+            }
+        }
+    },
+    402: {
+        "description": "Error filtering data",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error filtering data"}
+            }
+        }
+    },
+    403: {
+        "description": "Error processing data",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error processing data"}
+            }
+        }
+    },
+    404: {
+        "description": "Error compiling data",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error compiling data"}
+            }
+        }
+    },
+    460: {
+        "description": "No redo data found",
+        "content": {
+            "application/json": {
+                "example": {"detail": "No redo data found"}
+            }
+        }
+    },
+    406: {
+        "description": "Error compiling redo data",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error compiling redo data"}
+            }
+        }
+    },
+    407: {
+        "description": "Error merging data",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error merging data"}
+            }
+        }
+    },
+    408: {
+        "description": "Error dropping redo check column",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error dropping redo check column"}
+            }
+        }
+    },
+    409: {
+        "description": "Error logging success",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error logging success"}
+            }
+        }
+    },
+    500: {
+        "description": "Error connecting to database",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Error connecting to database"}
+            }
+        }
+    },
+    503: {
+        "description": "Server is busy, retry after the number of seconds in the Retry-After header",
+        "content": {
+            "application/json": {
+                "example": {"detail": "Server is busy"}
+            }
+        }
+    }
+}
+
+
+async def _excelBase64(redo_output_df, request: RedoInput):
+    async with stage("excel", requestPriority(request.startDate, request.endDate)):
+        async with timed("getExcelBase64"):
+            excel_base64 = await getExcelBase64(redo_output_df)
+    countBytes("xlsx", len(excel_base64["file"]))
+    return excel_base64
+
+
+def requestKey(request: RedoInput):
+    """Normalized key of the inputs that determine the pipeline output"""
+    accounts = ",".join(sorted({str(x) for x in request.accountNo}))
+    lookback_days = request.lookbackDays or settings.redo_lookback_days
+    mode = request.mode or settings.redo_mode
+    return f"{request.startDate}|{request.endDate}|{accounts}|{lookback_days}|{mode}"
+
+
+def etagMatches(if_none_match: Optional[str], etag: str):
+    """Whether an If-None-Match header matches etag, comparing tags weakly"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in if_none_match.split(","))
+
+
+async def _probeVersion(request: RedoInput, mode: str):
+    if mode == "index" and await asyncio.to_thread(indexReady):
+        return await indexVersion(request.startDate, request.endDate, request.accountNo)
+    # The probe's session counts against the db stage like the pipeline's, the slot is
+    # released before the pipeline queues for its own
+    async with stage("db", requestPriority(request.startDate, request.endDate), reject=True):
+        connection = await asyncio.to_thread(getConnection)
+        try:
+            return await dataVersion(request.startDate, request.endDate, request.accountNo, connection)
+        finally:
+            await asyncio.to_thread(connection.close)
+
+
+async def dataVersionTag(request: RedoInput, variant: str):
+    """ETag of a report: the request key, the output variant and the data version of the date range,
+    or None when tagging is disabled or the probe fails. The tag is weak because workbooks of the
+    same rows don't come out byte for byte the same."""
+    if not settings.etag_enabled:
+        return None
+    try:
+        async with timed("dataVersion"):
+            version = await _probeVersion(request, request.mode or settings.redo_mode)
+    except AdmissionRejected as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.warning("Error probing data version, not tagging the report: %s", e)
+        return None
+    digest = hashlib.sha256(f"{requestKey(request)}|{variant}|{version[0]}|{version[1]}".encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+async def runRedoPipeline(request: RedoInput):
+    """Run the redo pipeline for a request and return the merged output frame, or a
+    PartitionedResult for partitioned runs. Identical requests in flight at the same time share one run."""
+    return await singleFlight(requestKey(request), lambda: _runRedoPipeline(request))
+
+
+async def _runRedoPipeline(request: RedoInput):
+    """Run the redo pipeline while holding a database stage slot, so only a bounded number of
+    requests hold a database session. Requests beyond the queue depth are turned away right away."""
+    priority = requestPriority(request.startDate, request.endDate)
+    try:
+        async with stage("db", priority, reject=True), inFlight():
+            return await _runRedoStages(request, priority)
+    except AdmissionRejected as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+
+
+def partitionCount(request: RedoInput):
+    """Number of SERIALNO partitions a request runs with, 0 runs it in memory"""
+    if request.partitions is not None:
+        return request.partitions
+    if settings.redo_partition_min_days <= 0:
+        return 0
+    try:
+        days = (date.fromisoformat(request.endDate) - date.fromisoformat(request.startDate)).days
+    except ValueError:
+        # Invalid dates are rejected later by the pipeline
+        return 0
+    return settings.redo_partitions if days >= settings.redo_partition_min_days else 0
+
+
+async def _runRedoStages(request: RedoInput, priority: int):
+    """Run the redo pipeline for a request and return the merged output frame.
+    The database connection is returned to the pool before the frame is returned."""
+    mode = request.mode or settings.redo_mode
+    if mode == "index" and not await asyncio.to_thread(indexReady):
+        logger.warning("Local index is not ready, falling back to pandas mode")
+        mode = "pandas"
+
+    connection = None
+    if mode != "index":
+        try:
+            logger.info("Connecting to database")
+            # Acquire a pooled connection in thread pool since it may block waiting for a free session
+            async with timed("connect"):
+                connection = await asyncio.to_thread(getConnection)
+        except Exception as e:
+            logger.error("Error connecting to database: %s", e)
+            raise HTTPException(status_code=500, detail="Error connecting to database")
+    
+    partitions = partitionCount(request)
+    if partitions and mode != "sql":
+        return await _runPartitionedStages(request, priority, mode, connection, partitions)
+
+    if mode == "sql":
+        try:
+            logger.info("Retrieving redo data from database for date range: %s to %s", request.startDate, request.endDate)
+            lookback_days = request.lookbackDays or settings.redo_lookback_days
+            async with timed("redoServerSide") as span:
+                redo_output_df = await redoServerSide(request.startDate, request.endDate, request.accountNo, lookback_days, connection)
+                span.rows = len(redo_output_df)
+        except Exception as e:
+            logger.error("Error retrieving redo data: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=401, detail="Error retrieving data from database")
+
+        if redo_output_df['REDOTKTNO'].notna().sum() == 0:
+            logger.info("No redo data found")
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=460, detail="No redo data found")
+    else:
+        try:
+            logger.info("Retrieving ticket list for date range: %s to %s", request.startDate, request.endDate)
+
+            async with timed("indexInput" if mode == "index" else "redoInput") as span:
+                if mode == "index":
+                    df = await indexInput(request.startDate, request.endDate, request.accountNo)
+                else:
+                    df = await redoInput(request.startDate, request.endDate, request.accountNo, connection)
+                span.rows = len(df)
+        except Exception as e:
+            logger.error("Error retrieving ticket list: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=401, detail="Error retrieving data from database")
+    
+        try:
+            logger.info("Filtering data")
+            async with stage("cpu", priority), timed("mainFilter") as span:
+                df = await mainFilter(df)
+                span.rows = len(df)
+        except Exception as e:
+            logger.error("Error filtering data: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=402, detail="Error filtering data")
+    
+        try:
+            logger.info("Processing data")
+            async with stage("cpu", priority), timed("processData") as span:
+                filtered_df = await processData(df, request.lookbackDays)
+                span.rows = len(filtered_df)
+        except Exception as e:
+            logger.error("Error processing data: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=403, detail="Error processing data")
+    
+        try:
+            logger.info("Compiling data")
+            # Only the REDO_CHECK column is needed, not a copy of every redo row
+            separate_df = filtered_df['REDO_CHECK'].dropna()
+        except Exception as e:
+            logger.error("Error compiling data: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=404, detail="Error compiling separate data")
+    
+        try:
+            logger.info("Compiling redo data")
+            tupe = tuple(separate_df.astype(int))
+            logger.info("Found %s redo tickets", len(tupe))
+            logger.debug("Redo tickets: %s", tupe)
+            redo_tupe = tuple(f'{x}' for x in tupe)
+
+
+            if redo_tupe == ():
+                logger.info("No redo data found")
+                if connection:
+                    await asyncio.to_thread(connection.close)
+                raise HTTPException(status_code=460, detail="No redo data found")
+
+            async with timed("indexOutput" if mode == "index" else "redoOutput") as span:
+                if mode == "index":
+                    output = await indexOutput(redo_tupe, request.startDate, request.endDate)
+                else:
+                    output = await redoOutput(redo_tupe, request.startDate, request.endDate, connection)
+                span.rows = len(output)
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error compiling redo data: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=406, detail="Error compiling redo data")
+    
+        try:
+            logger.info("Merging data")
+            async with stage("cpu", priority), timed("mergeWithRedo") as span:
+                redo_output_df = await mergeWithRedo(filtered_df, output)
+                span.rows = len(redo_output_df)
+        except Exception as e:
+            logger.error("Error merging data: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=407, detail="Error merging data")
+    
+        try:
+            logger.info("Dropping redo check column")
+            redo_output_df.drop('REDO_CHECK', axis=1, inplace=True)
+        except Exception as e:
+            logger.error("Error dropping redo check column: %s", e)
+            if connection:
+                await asyncio.to_thread(connection.close)
+            raise HTTPException(status_code=408, detail="Error dropping redo check column")
+    
+    try:
+        logger.info("Successfully processed redo data. Output shape: %s. Date range: %s to %s", redo_output_df.shape, request.startDate, request.endDate)
+    except Exception as e:
+        logger.error("Error logging success: %s", e)
+        if connection:
+            await asyncio.to_thread(connection.close)
+        raise HTTPException(status_code=409, detail="Error logging success")
+
+    # Close the connection
+    try:
+        if connection:
+            await asyncio.to_thread(connection.close)
+            logger.info("Database connection closed successfully")
+    except Exception as e:
+        logger.warning("Error closing database connection: %s", e)
+    
+    return redo_output_df
+
+
+async def _runPartitionedStages(request: RedoInput, priority: int, mode: str, connection, partitions: int):
+    """Partitioned variant of the pandas and index modes. The tickets are spilled to disk by
+    SERIALNO hash while they are fetched, then every partition runs through the pipeline on its
+    own, so memory is bounded by the largest partition instead of by the date range.
+    Returns a PartitionedResult with the same rows as the in-memory output."""
+    result = PartitionedResult(partitions)
+    try:
+        try:
+            logger.info("Spilling ticket list into %s partitions", partitions)
+            if mode == "index":
+                batches = streamIndexInput(request.startDate, request.endDate, request.accountNo)
+            else:
+                batches = streamRedoInput(request.startDate, request.endDate, request.accountNo, connection)
+            async with timed("indexInput" if mode == "index" else "redoInput") as span:
+                span.rows = 0
+                async for df in batches:
+                    span.rows += len(df)
+                    await asyncio.to_thread(result.input.append, df)
+        except Exception as e:
+            logger.error("Error retrieving ticket list: %s", e)
+            raise HTTPException(status_code=401, detail="Error retrieving data from database")
+
+        redo_tickets = 0
+        for partition in range(partitions):
+            df = await asyncio.to_thread(result.input.load, partition)
+            if df is None:
+                continue
+
+            try:
+                async with stage("cpu", priority), timed("mainFilter") as span:
+                    df = await mainFilter(df)
+                    span.rows = len(df)
+            except Exception as e:
+                logger.error("Error filtering data: %s", e)
+                raise HTTPException(status_code=402, detail="Error filtering data")
+            if df.empty:
+                continue
+
+            try:
+                async with stage("cpu", priority), timed("processData") as span:
+                    filtered_df = await processData(df, request.lookbackDays)
+                    span.rows = len(filtered_df)
+            except Exception as e:
+                logger.error("Error processing data: %s", e)
+                raise HTTPException(status_code=403, detail="Error processing data")
+
+            try:
+                separate_df = filtered_df['REDO_CHECK'].dropna()
+            except Exception as e:
+                logger.error("Error compiling data: %s", e)
+                raise HTTPException(status_code=404, detail="Error compiling separate data")
+
+            try:
+                redo_tupe = tuple(f'{x}' for x in separate_df.astype(int))
+                redo_tickets += len(redo_tupe)
+                if not redo_tupe:
+                    output = emptyRedoOutput()
+                else:
+                    async with timed("indexOutput" if mode == "index" else "redoOutput") as span:
+                        if mode == "index":
+                            output = await indexOutput(redo_tupe, request.startDate, request.endDate)
+                        else:
+                            output = await redoOutput(redo_tupe, request.startDate, request.endDate, connection)
+                        span.rows = len(output)
+                if output.empty:
+                    output = emptyRedoOutput()
+            except Exception as e:
+                logger.error("Error compiling redo data: %s", e)
+                raise HTTPException(status_code=406, detail="Error compiling redo data")
+
+            try:
+                async with stage("cpu", priority), timed("mergeWithRedo") as span:
+                    redo_output_df = await mergeWithRedo(filtered_df, output)
+                    span.rows = len(redo_output_df)
+                redo_output_df.drop('REDO_CHECK', axis=1, inplace=True)
+            except Exception as e:
+                logger.error("Error merging data: %s", e)
+                raise HTTPException(status_code=407, detail="Error merging data")
+
+            async with timed("spill"):
+                await asyncio.to_thread(result.append, partition, redo_output_df)
+            logger.info("Partition %s/%s: %s rows, %s redo tickets", partition + 1, partitions, len(redo_output_df), len(redo_tupe))
+
+        if redo_tickets == 0:
+            logger.info("No redo data found")
+            raise HTTPException(status_code=460, detail="No redo data found")
+    except BaseException:
+        result.close()
+        raise
+    finally:
+        if connection:
+            await asyncio.to_thread(connection.close)
+            logger.info("Database connection closed successfully")
+
+    logger.info("Successfully processed redo data in %s partitions. Output rows: %s. Date range: %s to %s", partitions, len(result), request.startDate, request.endDate)
+    return result
+
+
 @router.post("/single",
     summary="Process a single date range of redo tickets",
     description="""
@@ -76,7 +542,17 @@ class RedoInput(BaseModel):
     3. Merging with ticket information
     4. Generating an Excel file with the results
 
+    With `mode` set to `sql`, steps 1-3 are computed by the database in a single query.
+    With `mode` set to `index`, the tickets are read from the local index that is synced in the background.
+
     The returned base64 encoded Excel file can be used to download the file or displayed in a web browser.
+
+    The output can instead be streamed as CSV, Parquet or NDJSON by setting `format` or by sending
+    `Accept: text/csv`, `application/vnd.apache.parquet` or `application/x-ndjson`. Only the
+    top-ranked media range of the header counts, and one with `q=0` is never chosen.
+
+    Reports carry an `ETag` from the number of tickets in the date range and their latest completion
+    time. Send it back in `If-None-Match` to get a 304 without a body when no ticket changed.
     """,
     response_description="Base64 encoded Excel file with the processed data",
     responses={
@@ -88,210 +564,117 @@ class RedoInput(BaseModel):
                         "filename": "redo_output.xlsx",
                         "file": "UEsDBBQAAAgIAMBe..." # Truncated base64 example
                     }
-                }
+                },
+                "text/csv": {},
+                "application/vnd.apache.parquet": {},
+                "application/x-ndjson": {}
             }
         },
-        401: {
-            "description": "Error retrieving data from database",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error retrieving data from database"}
-                }
-            }
+        304: {
+            "description": "Not modified, no ticket in the date range changed since the report with the ETag in If-None-Match"
         },
-        402: {
-            "description": "Error filtering data",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error filtering data"}
-                }
-            }
-        },
-        403: {
-            "description": "Error processing data",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error processing data"}
-                }
-            }
-        },
-        404: {
-            "description": "Error compiling data",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error compiling data"}
-                }
-            }
-        },
-        460: {
-            "description": "No redo data found",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "No redo data found"}
-                }
-            }
-        },
-        406: {
-            "description": "Error compiling redo data",
+        410: {
+            "description": "Error getting excel base64",
             "content": {
                 "application/json": {
-                    "example": {"detail": "Error compiling redo data"}
+                    "example": {"detail": "Error getting excel base64"}
                 }
             }
         },
-        407: {
-            "description": "Error merging data",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error merging data"}
-                }
+        **redoResponses
+    }
+)
+async def singleRedo(
+    request: RedoInput,
+    response: Response,
+    accept: Optional[str] = Header(None, include_in_schema=False),
+    if_none_match: Optional[str] = Header(None, include_in_schema=False)
+):
+    output_format = request.format or formatFromAccept(accept) or "xlsx"
+    # The data version is read before the pipeline runs, so a change during the run gives the next poll a new tag
+    etag = await dataVersionTag(request, f"{output_format}|{request.compression}")
+    if etag and etagMatches(if_none_match, etag):
+        logger.info("Report not modified")
+        return Response(status_code=304, headers={"ETag": etag})
+
+    redo_output_df = await runRedoPipeline(request)
+
+    if output_format != "xlsx":
+        logger.info("Streaming %s output", output_format)
+        return StreamingResponse(
+            iterCounted(iterExport(redo_output_df, output_format, request.compression), output_format),
+            media_type=exportMediaType(output_format, request.compression),
+            headers={
+                "Content-Disposition": f'attachment; filename="{exportFilename(output_format, request.compression)}"',
+                **({"ETag": etag} if etag else {})
             }
-        },
-        408: {
-            "description": "Error dropping redo check column",
+        )
+
+    try:
+        logger.info("Getting excel base64")
+        excel_base64 = await singleFlight(f"{requestKey(request)}|xlsx", lambda: _excelBase64(redo_output_df, request))
+    except Exception as e:
+        logger.error("Error getting excel base64: %s", e)
+        raise HTTPException(status_code=410, detail="Error getting excel base64")
+
+    if etag:
+        response.headers["ETag"] = etag
+    return excel_base64
+
+
+@router.post("/download",
+    summary="Download a single date range of redo tickets",
+    description="""
+    Processes redo data for a specified date range like `/redo/single`, but streams the Excel file
+    as a binary download instead of returning it base64 encoded in JSON. Supports `If-None-Match`
+    like `/redo/single`.
+    """,
+    response_class=StreamingResponse,
+    response_description="Excel file with the processed data",
+    responses={
+        200: {
+            "description": "Successful response",
             "content": {
-                "application/json": {
-                    "example": {"detail": "Error dropping redo check column"}
-                }
+                XLSX_MEDIA_TYPE: {}
             }
         },
-        409: {
-            "description": "Error logging success",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error logging success"}
-                }
-            }
+        304: {
+            "description": "Not modified, no ticket in the date range changed since the report with the ETag in If-None-Match"
         },
         410: {
-            "description": "Error getting excel base64",
+            "description": "Error getting excel file",
             "content": {
                 "application/json": {
-                    "example": {"detail": "Error getting excel base64"}
+                    "example": {"detail": "Error getting excel file"}
                 }
             }
         },
-        500: {
-            "description": "Error connecting to database",
-            "content": {
-                "application/json": {
-                    "example": {"detail": "Error connecting to database"}
-                }
-            }
-        }
+        **redoResponses
     }
 )
-async def singleRedo(request: RedoInput):
-    connection = None
-    try:
-        logger.info("Connecting to database")
-        # Run connection in thread pool since it's blocking I/O
-        connection = await asyncio.to_thread(getConnection)
-    except Exception as e:
-        logger.error(f"Error connecting to database: {e}")
-        raise HTTPException(status_code=500, detail="Error connecting to database")
-    
-    try:
-        logger.info("Retrieving ticket list for date range: %s to %s", request.startDate, request.endDate)
-
-        df = await redoInput(request.startDate, request.endDate, request.accountNo, connection)
-    except Exception as e:
-        logger.error(f"Error retrieving ticket list: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=401, detail="Error retrieving data from database")
-    
-    try:
-        logger.info("Filtering data")
-        df = await mainFilter(df)
-    except Exception as e:
-        logger.error(f"Error filtering data: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=402, detail="Error filtering data")
-    
-    try:
-        logger.info("Processing data")
-        df['REDO_CHECK'] = None
-        serial = list(df['SERIALNO'].unique())
-        filtered_df = await processData(df, serial)
-    except Exception as e:
-        logger.error(f"Error processing data: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=403, detail="Error processing data")
-    
-    try:
-        logger.info("Compiling data")
-        separate_df = filtered_df.dropna(subset=['REDO_CHECK'])
-    except Exception as e:
-        logger.error(f"Error compiling data: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=404, detail="Error compiling separate data")
-    
-    try:
-        logger.info("Compiling redo data")
-        tupe = tuple(separate_df['REDO_CHECK'].astype(int))
-        logger.info(f"Redo tuple: {tupe}")
-        redo_tupe = tuple(f'{x}' for x in tupe)
+async def downloadRedo(request: RedoInput, if_none_match: Optional[str] = Header(None, include_in_schema=False)):
+    etag = await dataVersionTag(request, "download")
+    if etag and etagMatches(if_none_match, etag):
+        logger.info("Report not modified")
+        return Response(status_code=304, headers={"ETag": etag})
 
+    redo_output_df = await runRedoPipeline(request)
 
-        if redo_tupe == ():
-            logger.info("No redo data found")
-            raise HTTPException(status_code=460, detail="No redo data found")
-
-        output = await redoOutput(redo_tupe, request.startDate, request.endDate, connection)
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error compiling redo data: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=406, detail="Error compiling redo data")
-    
     try:
-        logger.info("Merging data")
-        redo_output_df = await mergeWithRedo(filtered_df, output)
+        logger.info("Getting excel file")
+        async with stage("excel", requestPriority(request.startDate, request.endDate)), timed("getExcelFile"):
+            file, size = await getExcelFile(redo_output_df)
+        countBytes("xlsx", size)
     except Exception as e:
-        logger.error(f"Error merging data: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=407, detail="Error merging data")
-    
-    try:
-        logger.info("Dropping redo check column")
-        redo_output_df = redo_output_df.drop('REDO_CHECK', axis=1)
-    except Exception as e:
-        logger.error(f"Error dropping redo check column: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=408, detail="Error dropping redo check column")
-    
-    try:
-        logger.info(f"Successfully processed redo data. Output shape: {redo_output_df.shape}. Date range: {request.startDate} to {request.endDate}")
-    except Exception as e:
-        logger.error(f"Error logging success: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=409, detail="Error logging success")
+        logger.error("Error getting excel file: %s", e)
+        raise HTTPException(status_code=410, detail="Error getting excel file")
 
-    try:
-        logger.info("Getting excel base64")
-        excel_base64 = await getExcelBase64(redo_output_df)
-    except Exception as e:
-        logger.error(f"Error getting excel base64: {e}")
-        if connection:
-            await asyncio.to_thread(connection.close)
-        raise HTTPException(status_code=410, detail="Error getting excel base64")
-    
-    # Close the connection
-    try:
-        if connection:
-            await asyncio.to_thread(connection.close)
-            logger.info("Database connection closed successfully")
-    except Exception as e:
-        logger.warning(f"Error closing database connection: {e}")
-    
-    return excel_base64
\ No newline at end of file
+    return StreamingResponse(
+        iterFile(file),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": 'attachment; filename="redo_output.xlsx"',
+            **({"ETag": etag} if etag else {})
+        }
+    )
@@ -0,0 +1,184 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from pydantic import Field
+from typing import Optional, List
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+import numpy as np
+from app.core.config import settings
+from app.routers.redo import RedoInput, redoResponses, requestKey, runRedoPipeline
+from app.utils.partition import PartitionedResult
+from app.utils.singleflight import singleFlight
+from app.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Materialized results: request key -> (frame, size in bytes, expires), least recently used first.
+# Kept apart from the result cache so paging doesn't evict cached partitions or count in its stats.
+_results = OrderedDict()
+_results_bytes = 0
+
+
+router = APIRouter(
+    prefix="/redo",
+    tags=["redo"],
+    responses={
+        410: {
+            "description": "Invalid API key",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid API key"}
+                }
+            }
+        }
+    }
+)
+
+class RedoRowsInput(RedoInput):
+    after: Optional[int] = Field(
+        None,
+        description="TICKETNO the page starts after, the nextAfter of the previous page. Omit it for the first page.",
+        example=4012345678
+    )
+    pageSize: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Rows per page. Defaults to the server setting (500), at most the server maximum (10000).",
+        example=500
+    )
+    columns: Optional[List[str]] = Field(
+        None,
+        description="Columns to return, in this order. Defaults to every column of the /redo/single output.",
+        example=["TICKETNO", "SERIALNO", "COMPLETEDATE", "REDOTKTNO"]
+    )
+
+
+def _sortByTicket(result):
+    """Output sorted by TICKETNO and its size in bytes.
+    A PartitionedResult is shared with the /redo/single, /redo/download and job runs of the same
+    request, so it isn't closed here: its spill directory goes when the last reference does"""
+    redo_output_df = result.toFrame() if isinstance(result, PartitionedResult) else result
+    redo_output_df = redo_output_df.sort_values("TICKETNO", kind="stable", ignore_index=True)
+    return redo_output_df, int(redo_output_df.memory_usage(index=True, deep=True).sum())
+
+
+def _getResult(key):
+    entry = _results.get(key)
+    if entry is None:
+        return None
+    if entry[2] <= time.time():
+        _dropResult(key)
+        return None
+    _results.move_to_end(key)
+    return entry[0]
+
+
+def _dropResult(key):
+    global _results_bytes
+    _results_bytes -= _results.pop(key)[1]
+
+
+def _putResult(key, df, size):
+    global _results_bytes
+    if settings.rows_ttl <= 0 or size > settings.rows_cache_bytes:
+        return
+    if key in _results:
+        _dropResult(key)
+    _results[key] = (df, size, time.time() + settings.rows_ttl)
+    _results_bytes += size
+    while _results_bytes > settings.rows_cache_bytes:
+        _dropResult(next(iter(_results)))
+
+
+async def _materialize(request: RedoRowsInput):
+    """Merged output of a request sorted by TICKETNO, computed once and kept in memory for
+    rows_ttl seconds so the following pages are a binary search and a slice"""
+    # Only the event loop touches _results, so it needs no lock
+    key = requestKey(request)
+    redo_output_df = _getResult(key)
+    if redo_output_df is not None:
+        return redo_output_df
+
+    redo_output_df = await runRedoPipeline(request)
+    async with timed("materializeRows") as span:
+        redo_output_df, size = await asyncio.to_thread(_sortByTicket, redo_output_df)
+        span.rows = len(redo_output_df)
+    _putResult(key, redo_output_df, size)
+    return redo_output_df
+
+
+def pageBounds(tickets, after, page_size):
+    """[start, end) of the page of sorted tickets after the cursor. A page never ends in the
+    middle of a run of equal tickets, so the next cursor doesn't skip rows."""
+    start = 0 if after is None else int(np.searchsorted(tickets, after, side="right"))
+    end = min(start + page_size, len(tickets))
+    if start < end < len(tickets):
+        end = int(np.searchsorted(tickets, tickets[end - 1], side="right"))
+    return start, end
+
+
+@router.post("/rows",
+    summary="Page through the rows of a redo report",
+    description="""
+    Returns the rows of the `/redo/single` output as JSON, one page at a time in TICKETNO order,
+    with the columns listed in `columns`.
+
+    Pagination is by key: pass the `nextAfter` of a page as `after` to get the next page, with the
+    same other parameters. The last page has `nextAfter` null. The first page runs the pipeline
+    and keeps its output in memory for a few minutes, so the following pages cost a lookup
+    and a slice of the page instead of another pipeline run.
+    """,
+    response_class=Response,
+    response_description="One page of rows",
+    responses={
+        200: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "total": 18250,
+                        "nextAfter": 4012345678,
+                        "columns": ["TICKETNO", "SERIALNO", "REDOTKTNO"],
+                        "rows": [{"TICKETNO": 4012345001, "SERIALNO": "0A1B2C3D", "REDOTKTNO": None}]
+                    }
+                }
+            }
+        },
+        422: {
+            "description": "Unknown column or page size too large",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Unknown columns: TICKET"}
+                }
+            }
+        },
+        **redoResponses
+    }
+)
+async def rowsRedo(request: RedoRowsInput):
+    page_size = request.pageSize or settings.rows_page_size
+    if page_size > settings.rows_max_page_size:
+        raise HTTPException(status_code=422, detail=f"pageSize is at most {settings.rows_max_page_size}")
+
+    redo_output_df = await singleFlight(f"rows|{requestKey(request)}", lambda: _materialize(request))
+
+    columns = list(request.columns or redo_output_df.columns)
+    unknown = [column for column in columns if column not in redo_output_df.columns]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown columns: {', '.join(map(str, unknown))}")
+
+    tickets = redo_output_df["TICKETNO"].to_numpy()
+    start, end = pageBounds(tickets, request.after, page_size)
+    page = redo_output_df.iloc[start:end][columns]
+    next_after = int(tickets[end - 1]) if end < len(tickets) else None
+
+    # pandas encodes the rows, with missing values as null and dates in ISO format like the ndjson export
+    rows = page.to_json(orient="records", date_format="iso") if len(page) else "[]"
+    body = (
+        f'{{"total": {len(redo_output_df)}, "nextAfter": {json.dumps(next_after)}, '
+        f'"columns": {json.dumps([str(column) for column in columns])}, "rows": {rows}}}'
+    )
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,128 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date
+from app.core.config import settings
+
+# Lower values are served first
+PRIORITY_SMALL = 0
+PRIORITY_NORMAL = 1
+
+# Background jobs are already queued, they wait for a slot instead of being rejected
+rejectWhenFull = ContextVar("rejectWhenFull", default=True)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, stage, retry_after):
+        super().__init__(f"{stage} queue is full")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """Concurrency limit for one pipeline stage with a bounded priority queue of waiters"""
+
+    def __init__(self, name, limit, max_queue=None):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters = []
+        self._order = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    async def acquire(self, priority=PRIORITY_NORMAL, reject=True):
+        start = time.perf_counter()
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        else:
+            if reject and self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(self.name, settings.admission_retry_after)
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), future))
+            try:
+                # release() hands its slot over by resolving the future
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()
+                else:
+                    self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+                    heapq.heapify(self._waiters)
+                raise
+        wait = time.perf_counter() - start
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+_stages = {}
+
+
+def _getStage(name):
+    if name not in _stages:
+        limits = {
+            "db": (settings.admission_db_limit, settings.admission_queue_depth),
+            "cpu": (settings.admission_cpu_limit, None),
+            "excel": (settings.admission_excel_limit, None),
+        }
+        _stages[name] = StageLimiter(name, *limits[name])
+    return _stages[name]
+
+
+@asynccontextmanager
+async def stage(name, priority=PRIORITY_NORMAL, reject=False):
+    """Hold a slot of a pipeline stage. Only stages with a queue depth reject, and only when reject is set."""
+    limiter = _getStage(name)
+    await limiter.acquire(priority, reject and rejectWhenFull.get())
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def requestPriority(start_date, end_date):
+    """Small date ranges get the priority lane so they aren't stuck behind year-long reports"""
+    if not settings.admission_priority_lane:
+        return PRIORITY_NORMAL
+    try:
+        days = (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days
+    except ValueError:
+        # Invalid dates are rejected later by the pipeline
+        return PRIORITY_NORMAL
+    return PRIORITY_SMALL if days <= settings.admission_small_days else PRIORITY_NORMAL
+
+
+def getAdmissionStats():
+    return {name: _getStage(name).stats() for name in ("db", "cpu", "excel")}
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Memory tier: key -> (frame, size in bytes, expires), least recently used first
+_memory = OrderedDict()
+_memory_bytes = 0
+# Disk tier: key -> (path, size in bytes, expires), least recently used first
+_disk = OrderedDict()
+_disk_bytes = 0
+_lock = threading.Lock()
+# Names of the files _path writes, anything else in cache_dir isn't ours
+_CACHE_FILE = re.compile(r"[0-9a-f]{40}\.parquet")
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "memory_evictions": 0,
+    "disk_evictions": 0,
+    "invalidations": 0,
+}
+
+
+def _path(key):
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(settings.cache_dir, f"{name}.parquet")
+
+
+def _frameBytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _dropMemory(key):
+    global _memory_bytes
+    _, size, _ = _memory.pop(key)
+    _memory_bytes -= size
+
+
+def _dropDisk(key):
+    global _disk_bytes
+    path, size, _ = _disk.pop(key)
+    _disk_bytes -= size
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _putMemory(key, df, size, expires):
+    global _memory_bytes
+    if size > settings.cache_memory_bytes:
+        return
+    if key in _memory:
+        _dropMemory(key)
+    _memory[key] = (df, size, expires)
+    _memory_bytes += size
+    while _memory_bytes > settings.cache_memory_bytes:
+        _dropMemory(next(iter(_memory)))
+        _stats["memory_evictions"] += 1
+
+
+def _writeDisk(key, df, expires):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {
+        **(table.schema.metadata or {}),
+        b"cache_key": key.encode("utf-8"),
+        b"cache_expires": str(expires).encode("utf-8"),
+    }
+    os.makedirs(settings.cache_dir, exist_ok=True)
+    path = _path(key)
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+    return path, os.path.getsize(path)
+
+
+def _putDisk(key, path, size, expires):
+    global _disk_bytes
+    if key in _disk:
+        _disk_bytes -= _disk.pop(key)[1]
+    _disk[key] = (path, size, expires)
+    _disk_bytes += size
+    while _disk_bytes > settings.cache_disk_bytes and len(_disk) > 1:
+        _dropDisk(next(iter(_disk)))
+        _stats["disk_evictions"] += 1
+
+
+def cacheGet(key):
+    """Cached frame for key from the memory tier, then the disk tier, or None"""
+    import pyarrow.parquet as pq
+
+    frozen = json.dumps(list(key))
+    now = time.time()
+    with _lock:
+        if frozen in _memory:
+            df, _, expires = _memory[frozen]
+            if expires > now:
+                _memory.move_to_end(frozen)
+                _stats["memory_hits"] += 1
+                return df
+            _dropMemory(frozen)
+        path = None
+        if frozen in _disk:
+            path, _, expires = _disk[frozen]
+            if expires > now:
+                _disk.move_to_end(frozen)
+            else:
+                _dropDisk(frozen)
+                path = None
+        if path is None:
+            _stats["misses"] += 1
+            return None
+
+    # Read outside the lock so other requests aren't held up by disk I/O
+    try:
+        df = pq.read_table(path).to_pandas()
+    except Exception as e:
+        logger.warning("Error reading cache partition from disk: %s", e)
+        with _lock:
+            if frozen in _disk:
+                _dropDisk(frozen)
+            _stats["misses"] += 1
+        return None
+
+    # The deep size scan of object columns runs outside the lock too
+    size = _frameBytes(df)
+    with _lock:
+        _putMemory(frozen, df, size, expires)
+        _stats["disk_hits"] += 1
+    return df
+
+
+def cachePut(key, df, ttl):
+    """Store a frame in both tiers for ttl seconds"""
+    if ttl <= 0:
+        return
+    frozen = json.dumps(list(key))
+    expires = time.time() + ttl
+    size = _frameBytes(df)
+    with _lock:
+        _putMemory(frozen, df, size, expires)
+    try:
+        path, size = _writeDisk(frozen, df, expires)
+    except Exception as e:
+        logger.warning("Error writing cache partition to disk: %s", e)
+        return
+    with _lock:
+        _putDisk(frozen, path, size, expires)
+
+
+def invalidate(match=None):
+    """Drop every entry whose key satisfies match(key), or all entries. Returns the number dropped."""
+    dropped = set()
+    with _lock:
+        for frozen in list(_memory):
+            if match is None or match(json.loads(frozen)):
+                _dropMemory(frozen)
+                dropped.add(frozen)
+        for frozen in list(_disk):
+            if match is None or match(json.loads(frozen)):
+                _dropDisk(frozen)
+                dropped.add(frozen)
+        _stats["invalidations"] += len(dropped)
+    return len(dropped)
+
+
+def _removeQuietly(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning("Error removing cache partition %s: %s", path, e)
+
+
+def loadDiskCache():
+    """Rebuild the disk tier index from the partitions left by a previous run"""
+    global _disk_bytes
+    import pyarrow.parquet as pq
+
+    try:
+        os.makedirs(settings.cache_dir, exist_ok=True)
+        names = os.listdir(settings.cache_dir)
+    except OSError as e:
+        logger.warning("Error listing the cache directory, starting with an empty disk tier: %s", e)
+        return
+
+    now = time.time()
+    entries = []
+    for name in names:
+        path = os.path.join(settings.cache_dir, name)
+        if not _CACHE_FILE.fullmatch(name) or not os.path.isfile(path):
+            continue
+        try:
+            metadata = pq.read_schema(path).metadata
+            frozen = metadata[b"cache_key"].decode("utf-8")
+            expires = float(metadata[b"cache_expires"])
+        except Exception:
+            # A partition cut short by a crash
+            _removeQuietly(path)
+            continue
+        if _path(frozen) != path:
+            continue
+        if expires <= now:
+            _removeQuietly(path)
+            continue
+        try:
+            entries.append((os.path.getatime(path), frozen, path, os.path.getsize(path), expires))
+        except OSError:
+            continue
+
+    with _lock:
+        for _, frozen, path, size, expires in sorted(entries):
+            _disk[frozen] = (path, size, expires)
+            _disk_bytes += size
+    logger.info("Loaded %s cache partitions from disk", len(entries))
+
+
+def getCacheStats():
+    with _lock:
+        lookups = _stats["memory_hits"] + _stats["disk_hits"] + _stats["misses"]
+        hits = _stats["memory_hits"] + _stats["disk_hits"]
+        return {
+            **_stats,
+            "hit_ratio": hits / lookups if lookups else None,
+            "memory_entries": len(_memory),
+            "memory_bytes": _memory_bytes,
+            "disk_entries": len(_disk),
+            "disk_bytes": _disk_bytes,
+        }
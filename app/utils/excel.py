@@ -0,0 +1,129 @@
+import itertools
+import pandas as pd
+import numpy as np
+from app.core.config import settings
+from app.utils.partition import iterBatches, emptyFrame
+
+# Excel sheets hold at most 1,048,576 rows, one of them is the header
+EXCEL_MAX_ROWS = 1048576
+SHEET_ROWS = EXCEL_MAX_ROWS - 1
+
+# Datetime columns that only carry a date are written with a date format
+DATE_COLUMNS = ('COMPLETEDATE', 'ASSIGNDATE')
+DATE_FORMAT = 'yyyy-mm-dd'
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Rows converted to Python values at a time by the streaming engines
+BATCH_ROWS = 50000
+
+EXCEL_ENGINES = ("openpyxl", "write_only", "xlsxwriter")
+
+
+def sheetName(index):
+    return f"Sheet{index + 1}"
+
+
+def sheetSlices(n_rows):
+    """Row ranges for each sheet, splitting outputs over Excel's row limit"""
+    if n_rows == 0:
+        return [(0, 0)]
+    return [(start, min(start + SHEET_ROWS, n_rows)) for start in range(0, n_rows, SHEET_ROWS)]
+
+
+def _columnValues(series):
+    """Python values for a column, with missing values as None and date-only columns as dates"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = pd.DatetimeIndex(series).to_pydatetime().astype(object)
+        if series.name in DATE_COLUMNS:
+            values = np.array([v.date() if v is not None and not pd.isna(v) else None for v in values], dtype=object)
+    else:
+        values = series.astype(object).to_numpy()
+    values[pd.isna(series).to_numpy()] = None
+    return values
+
+
+def iterRows(df):
+    """Rows of df, a DataFrame or a PartitionedResult, as tuples of Python values, converted in batches"""
+    for batch in iterBatches(df, BATCH_ROWS):
+        columns = [_columnValues(batch[column]) for column in batch.columns]
+        yield from zip(*columns)
+
+
+def _writeOpenpyxl(df, file):
+    # Full object model - the whole workbook is kept in memory until it is saved
+    if not isinstance(df, pd.DataFrame):
+        df = df.toFrame()
+    with pd.ExcelWriter(file, engine="openpyxl") as writer:
+        for index, (start, end) in enumerate(sheetSlices(len(df))):
+            df.iloc[start:end].to_excel(writer, index=False, sheet_name=sheetName(index))
+
+
+def _writeWriteOnly(df, file):
+    # openpyxl write-only mode streams rows to the sheet instead of building cells in memory.
+    # Date values get their number format from openpyxl: dates as yyyy-mm-dd, datetimes with time.
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    bold = Font(bold=True)
+    rows = iterRows(df)
+    for index, (start, end) in enumerate(sheetSlices(len(df))):
+        worksheet = workbook.create_sheet(sheetName(index))
+        header = []
+        for column in df.columns:
+            cell = WriteOnlyCell(worksheet, value=str(column))
+            cell.font = bold
+            header.append(cell)
+        worksheet.append(header)
+        for row in itertools.islice(rows, end - start):
+            worksheet.append(row)
+    workbook.save(file)
+
+
+def _writeXlsxwriter(df, file):
+    # xlsxwriter constant_memory mode flushes each row to disk once the next row starts
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(file, {'constant_memory': True, 'remove_timezone': True})
+    bold = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': DATE_FORMAT})
+    datetime_format = workbook.add_format({'num_format': DATETIME_FORMAT})
+
+    # Typed formats for the date columns, everything else is written by type
+    formats = {}
+    head = emptyFrame(df)
+    for position, column in enumerate(head.columns):
+        if pd.api.types.is_datetime64_any_dtype(head[column]):
+            formats[position] = date_format if column in DATE_COLUMNS else datetime_format
+
+    rows = iterRows(df)
+    for index, (start, end) in enumerate(sheetSlices(len(df))):
+        worksheet = workbook.add_worksheet(sheetName(index))
+        worksheet.write_row(0, 0, [str(column) for column in df.columns], bold)
+        for position, cell_format in formats.items():
+            worksheet.set_column(position, position, 18 if cell_format is datetime_format else 11)
+        for row_index, row in enumerate(itertools.islice(rows, end - start), start=1):
+            for position, value in enumerate(row):
+                if value is None:
+                    continue
+                if position in formats:
+                    worksheet.write_datetime(row_index, position, value, formats[position])
+                else:
+                    worksheet.write(row_index, position, value)
+    workbook.close()
+
+
+_writers = {
+    "openpyxl": _writeOpenpyxl,
+    "write_only": _writeWriteOnly,
+    "xlsxwriter": _writeXlsxwriter,
+}
+
+
+def writeExcel(df, file, engine=None):
+    """Write df, a DataFrame or a PartitionedResult, as an xlsx workbook to a path or binary file object"""
+    engine = engine or settings.excel_engine
+    if engine not in _writers:
+        raise ValueError(f"Unknown excel engine: {engine}. Expected one of {EXCEL_ENGINES}")
+    _writers[engine](df, file)
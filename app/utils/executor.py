@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+class _ArrowFrame:
+    """DataFrame serialized as an Arrow IPC stream. Pickling the bytes is a single copy
+    instead of pickling every Python object of the frame."""
+
+    def __init__(self, df):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        self.data = sink.getvalue().to_pybytes()
+
+    def load(self):
+        import pyarrow as pa
+
+        return pa.ipc.open_stream(self.data).read_all().to_pandas()
+
+
+class _PickledFrame:
+    """Fallback for frames Arrow can't represent, such as object columns of mixed types"""
+
+    def __init__(self, df):
+        self.data = pickle.dumps(df, protocol=5)
+
+    def load(self):
+        return pickle.loads(self.data)
+
+
+def _pack(value):
+    if isinstance(value, list):
+        return [_pack(item) for item in value]
+    if not isinstance(value, pd.DataFrame):
+        return value
+    try:
+        return _ArrowFrame(value)
+    except Exception:
+        return _PickledFrame(value)
+
+
+def _unpack(value):
+    if isinstance(value, list):
+        return [_unpack(item) for item in value]
+    if isinstance(value, (_ArrowFrame, _PickledFrame)):
+        return value.load()
+    return value
+
+
+def _runPacked(fn, args):
+    # Runs in a worker process
+    return _pack(fn(*[_unpack(arg) for arg in args]))
+
+
+def _warm():
+    # Import the pipeline modules once so the first request doesn't pay for it
+    import pyarrow  # noqa: F401
+    import app.utils.process  # noqa: F401
+    return multiprocessing.current_process().pid
+
+
+def startProcessPool():
+    """Start and warm up the worker processes when execution_mode is "process" """
+    global _pool
+    if settings.execution_mode != "process" or _pool is not None:
+        return
+    # spawn rather than fork, the parent runs threads and holds database sessions
+    _pool = ProcessPoolExecutor(max_workers=settings.process_workers, mp_context=multiprocessing.get_context("spawn"))
+    pids = {future.result() for future in [_pool.submit(_warm) for _ in range(settings.process_workers * 2)]}
+    logger.info("Process pool started with %s warm workers", len(pids))
+
+
+def stopProcessPool():
+    global _pool
+    if _pool is None:
+        return
+    _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+
+
+async def runCpu(fn, *args):
+    """Run a CPU-bound stage in the process pool, or in a thread when the pool isn't running.
+    fn must be a module level function so worker processes can import it."""
+    if _pool is None:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    packed = await asyncio.to_thread(lambda: [_pack(arg) for arg in args])
+    result = await loop.run_in_executor(_pool, _runPacked, fn, packed)
+    return await asyncio.to_thread(_unpack, result)
@@ -0,0 +1,171 @@
+import json
+import shutil
+import tempfile
+import zipfile
+import zlib
+import pandas as pd
+from app.core.config import settings
+from app.utils.excel import writeExcel
+from app.utils.process import iterFile
+from app.utils.partition import iterBatches, emptyFrame
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+# Parquet is already compressed per column
+COMPRESSIBLE_FORMATS = ("csv", "ndjson")
+
+# Accept header media types -> format
+ACCEPT_FORMATS = {
+    "text/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+}
+
+
+def _acceptRanges(accept):
+    """(media type, q) of every media range of an Accept header, in the listed order"""
+    for media_range in accept.split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type:
+            yield media_type.lower(), q
+
+
+def formatFromAccept(accept):
+    """Streamable format of the top-ranked media range of an Accept header, or None. Ranges with
+    q=0 are refused, and ties on q go to the first listed streamable format."""
+    if not accept:
+        return None
+    ranges = [(media_type, q) for media_type, q in _acceptRanges(accept) if q > 0]
+    if not ranges:
+        return None
+    top = max(q for _, q in ranges)
+    for media_type, q in ranges:
+        if q == top and media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+    return None
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iterCsv(df, batch_rows=None):
+    """CSV bytes, one batch of rows at a time"""
+    batch_rows = batch_rows or settings.export_batch_rows
+    yield emptyFrame(df).to_csv(index=False).encode("utf-8")
+    for batch in iterBatches(df, batch_rows):
+        yield batch.to_csv(index=False, header=False).encode("utf-8")
+
+
+def iterNdjson(df, batch_rows=None):
+    """Newline delimited JSON records, one batch of rows at a time"""
+    batch_rows = batch_rows or settings.export_batch_rows
+    for batch in iterBatches(df, batch_rows):
+        yield batch.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+
+
+def iterParquet(df, batch_rows=None):
+    """Parquet file with one row group per batch. Parquet needs its footer before it can be read,
+    so the file is written to a spooled temp file first and then streamed."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    batch_rows = batch_rows or settings.export_batch_rows
+    file = tempfile.SpooledTemporaryFile(max_size=settings.excel_spool_max_size)
+    try:
+        if isinstance(df, pd.DataFrame):
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+        else:
+            # Object columns that are all null in a batch infer as null, so a partitioned result
+            # takes one pass over its batches to find the types of the whole output
+            schemas = [pa.Schema.from_pandas(batch, preserve_index=False) for batch in iterBatches(df, batch_rows)]
+            schemas = schemas or [pa.Schema.from_pandas(emptyFrame(df), preserve_index=False)]
+            schema = pa.unify_schemas(schemas, promote_options="permissive")
+        with pq.ParquetWriter(file, schema) as writer:
+            for batch in iterBatches(df, batch_rows):
+                writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+        file.seek(0)
+    except Exception:
+        file.close()
+        raise
+    yield from iterFile(file)
+
+
+_exporters = {
+    "csv": iterCsv,
+    "parquet": iterParquet,
+    "ndjson": iterNdjson,
+}
+
+
+def _compressed(output_format, compression):
+    return compression == "gzip" and output_format in COMPRESSIBLE_FORMATS
+
+
+def iterExport(df, output_format, compression=None):
+    """Encoded output for df, a DataFrame or a PartitionedResult, in a streamable format, optionally gzip compressed"""
+    chunks = _exporters[output_format](df)
+    if _compressed(output_format, compression):
+        chunks = _gzip(chunks)
+    return chunks
+
+
+def exportMediaType(output_format, compression=None):
+    if _compressed(output_format, compression):
+        return "application/gzip"
+    return EXPORT_FORMATS[output_format][0]
+
+
+def exportFilename(output_format, compression=None):
+    filename = f"redo_output.{EXPORT_FORMATS[output_format][1]}"
+    if _compressed(output_format, compression):
+        filename += ".gz"
+    return filename
+
+
+def outputExtension(output_format):
+    """File extension of xlsx or a streamable format"""
+    if output_format == "xlsx":
+        return "xlsx"
+    return EXPORT_FORMATS[output_format][1]
+
+
+def writeArchive(file, outputs, output_format, manifest=None):
+    """Zip archive with one file per (filename, df) in outputs, written to a binary file object.
+    Every output is written to a spooled temp file first, since the Excel writers build a zip of
+    their own and need a seekable file. manifest is added as manifest.json."""
+    # xlsx and parquet are already compressed
+    compression = zipfile.ZIP_DEFLATED if output_format in COMPRESSIBLE_FORMATS else zipfile.ZIP_STORED
+    with zipfile.ZipFile(file, "w", compression=compression) as archive:
+        for filename, df in outputs:
+            with tempfile.SpooledTemporaryFile(max_size=settings.excel_spool_max_size) as output:
+                if output_format == "xlsx":
+                    writeExcel(df, output)
+                else:
+                    for chunk in iterExport(df, output_format):
+                        output.write(chunk)
+                output.seek(0)
+                with archive.open(filename, "w") as entry:
+                    shutil.copyfileobj(output, entry)
+        if manifest is not None:
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from app.core.config import settings
+from app.core.logs import requestId
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Result files are named by job id, uuid4().hex
+_JOB_FILE = re.compile(r"[0-9a-f]{32}")
+
+_jobs = {}
+_queue = None
+_workers = []
+_cleaner = None
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _jobStatus(job):
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+        "error": job["error"],
+    }
+
+
+async def _runJob(job):
+    # The job runs in its own task, records logged for it carry the job id
+    requestId.set(job["id"])
+    job["status"] = RUNNING
+    job["started"] = time.time()
+    try:
+        job["filename"], job["media_type"] = await job["run"](job["path"])
+        job["status"] = DONE
+    except asyncio.CancelledError:
+        job["status"] = CANCELLED
+        _removeFile(job)
+    except Exception as e:
+        # HTTPException from the pipeline carries the stage that failed in its detail
+        job["status"] = FAILED
+        job["error"] = getattr(e, "detail", None) or str(e)
+        _removeFile(job)
+        logger.error("Job %s failed: %s", job['id'], e)
+    finally:
+        job["finished"] = time.time()
+        job["run"] = None
+
+
+async def _worker():
+    while True:
+        job = await _queue.get()
+        try:
+            if job["status"] != QUEUED:
+                # Cancelled while waiting in the queue
+                continue
+            job["task"] = asyncio.create_task(_runJob(job))
+            await job["task"]
+        finally:
+            _queue.task_done()
+
+
+def _removeFile(job):
+    try:
+        os.remove(job["path"])
+    except FileNotFoundError:
+        pass
+
+
+def cleanupJobs():
+    """Remove finished jobs and their results once they are older than job_ttl"""
+    expired_before = time.time() - settings.job_ttl
+    for job_id, job in list(_jobs.items()):
+        if job["finished"] is not None and job["finished"] < expired_before:
+            _removeFile(job)
+            del _jobs[job_id]
+            logger.info("Job %s expired", job_id)
+
+
+async def _cleanerLoop():
+    while True:
+        await asyncio.sleep(settings.job_cleanup_interval)
+        cleanupJobs()
+
+
+def sweepJobDir():
+    """Remove the results left in job_dir by a previous process. Job state only lives in memory,
+    so nothing can download them and the TTL cleanup would never see them."""
+    removed = 0
+    for name in os.listdir(settings.job_dir):
+        path = os.path.join(settings.job_dir, name)
+        # Only job ids, job_dir may be shared with other files
+        if not _JOB_FILE.fullmatch(name) or not os.path.isfile(path):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning("Error removing job result %s: %s", path, e)
+    if removed:
+        logger.info("Removed %s job results of a previous run", removed)
+
+
+def startJobWorkers():
+    """Start the bounded job worker pool and the TTL cleanup task"""
+    global _queue, _cleaner
+    os.makedirs(settings.job_dir, exist_ok=True)
+    sweepJobDir()
+    _queue = asyncio.Queue(maxsize=settings.job_queue_size)
+    for _ in range(settings.job_workers):
+        _workers.append(asyncio.create_task(_worker()))
+    _cleaner = asyncio.create_task(_cleanerLoop())
+
+
+async def stopJobWorkers():
+    """Cancel running jobs and stop the workers"""
+    global _cleaner
+    for job in _jobs.values():
+        if job["status"] == RUNNING and job.get("task"):
+            job["task"].cancel()
+    tasks = _workers + ([_cleaner] if _cleaner else [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _cleaner = None
+
+
+def submitJob(run):
+    """Queue a job. run is an async callable that writes the result to the path it is given
+    and returns (filename, media_type)."""
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "status": QUEUED,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+        "error": None,
+        "path": os.path.join(settings.job_dir, job_id),
+        "filename": None,
+        "media_type": None,
+        "run": run,
+        "task": None,
+    }
+    try:
+        _queue.put_nowait(job)
+    except asyncio.QueueFull:
+        raise JobQueueFull(f"Job queue is full ({settings.job_queue_size} jobs)")
+    _jobs[job_id] = job
+    return _jobStatus(job)
+
+
+def getJob(job_id):
+    return _jobs.get(job_id)
+
+
+def getJobStatus(job_id):
+    job = _jobs.get(job_id)
+    return _jobStatus(job) if job else None
+
+
+def cancelJob(job_id):
+    """Cancel a queued or running job. Finished jobs are left as they are."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    if job["status"] == QUEUED:
+        job["status"] = CANCELLED
+        job["finished"] = time.time()
+        job["run"] = None
+    elif job["status"] == RUNNING and job["task"]:
+        job["task"].cancel()
+    return _jobStatus(job)
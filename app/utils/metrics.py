@@ -0,0 +1,151 @@
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds of the stage latency histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Stage timings of the current request for the Server-Timing header, None when it isn't collected
+requestTimings = ContextVar("requestTimings", default=None)
+
+_lock = threading.Lock()
+# stage -> [bucket counts..., +Inf count], sum of seconds
+_stage_buckets = {}
+_stage_sums = {}
+_stage_errors = {}
+_stage_rows = {}
+_stage_in_flight = {}
+# output format -> bytes
+_output_bytes = {}
+_counters = {
+    "db_round_trips": 0,
+    "db_rows_fetched": 0,
+    "requests_in_flight": 0,
+}
+
+
+def _observe(stage, seconds):
+    buckets = _stage_buckets.setdefault(stage, [0] * (len(STAGE_BUCKETS) + 1))
+    for position, bound in enumerate(STAGE_BUCKETS):
+        if seconds <= bound:
+            buckets[position] += 1
+    buckets[-1] += 1
+    _stage_sums[stage] = _stage_sums.get(stage, 0.0) + seconds
+
+
+class Span:
+    """One timed run of a stage. Set rows to the number of rows the stage produced."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.rows = None
+        self.seconds = None
+
+
+@asynccontextmanager
+async def timed(stage):
+    """Time a pipeline stage: latency histogram, error and row counters, in-flight gauge
+    and an entry in the Server-Timing header of the request"""
+    span = Span(stage)
+    with _lock:
+        _stage_in_flight[stage] = _stage_in_flight.get(stage, 0) + 1
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        with _lock:
+            _stage_errors[stage] = _stage_errors.get(stage, 0) + 1
+        raise
+    finally:
+        span.seconds = time.perf_counter() - start
+        with _lock:
+            _stage_in_flight[stage] -= 1
+            _observe(stage, span.seconds)
+            if span.rows is not None:
+                _stage_rows[stage] = _stage_rows.get(stage, 0) + span.rows
+        timings = requestTimings.get()
+        if timings is not None:
+            timings.append((stage, span.seconds))
+
+
+def countRoundTrips(round_trips, rows=0):
+    """Called from the fetch threads for every execute and fetch round trip"""
+    with _lock:
+        _counters["db_round_trips"] += round_trips
+        _counters["db_rows_fetched"] += rows
+
+
+def countBytes(output_format, size):
+    with _lock:
+        _output_bytes[output_format] = _output_bytes.get(output_format, 0) + size
+
+
+def iterCounted(chunks, output_format):
+    """Pass chunks through, counting the bytes sent for output_format"""
+    for chunk in chunks:
+        countBytes(output_format, len(chunk))
+        yield chunk
+
+
+@asynccontextmanager
+async def inFlight():
+    with _lock:
+        _counters["requests_in_flight"] += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _counters["requests_in_flight"] -= 1
+
+
+def serverTiming(timings):
+    """Server-Timing header value, stages that ran more than once are summed"""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def _line(name, value, labels=None):
+    if labels:
+        label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+
+def renderMetrics(gauges=None):
+    """Metrics in the Prometheus text exposition format. gauges adds {name: (help, value or {labels: value})}."""
+    lines = []
+    with _lock:
+        lines += ["# HELP redo_stage_seconds Latency of the redo pipeline stages", "# TYPE redo_stage_seconds histogram"]
+        for stage, buckets in _stage_buckets.items():
+            for bound, count in zip(STAGE_BUCKETS, buckets):
+                lines.append(_line("redo_stage_seconds_bucket", count, {"stage": stage, "le": bound}))
+            lines.append(_line("redo_stage_seconds_bucket", buckets[-1], {"stage": stage, "le": "+Inf"}))
+            lines.append(_line("redo_stage_seconds_sum", _stage_sums[stage], {"stage": stage}))
+            lines.append(_line("redo_stage_seconds_count", buckets[-1], {"stage": stage}))
+
+        lines += ["# HELP redo_stage_errors_total Failed runs of the redo pipeline stages", "# TYPE redo_stage_errors_total counter"]
+        lines += [_line("redo_stage_errors_total", count, {"stage": stage}) for stage, count in _stage_errors.items()]
+        lines += ["# HELP redo_stage_rows_total Rows produced by the redo pipeline stages", "# TYPE redo_stage_rows_total counter"]
+        lines += [_line("redo_stage_rows_total", count, {"stage": stage}) for stage, count in _stage_rows.items()]
+        lines += ["# HELP redo_stage_in_flight Redo pipeline stages running now", "# TYPE redo_stage_in_flight gauge"]
+        lines += [_line("redo_stage_in_flight", count, {"stage": stage}) for stage, count in _stage_in_flight.items()]
+        lines += ["# HELP redo_output_bytes_total Bytes of redo output produced", "# TYPE redo_output_bytes_total counter"]
+        lines += [_line("redo_output_bytes_total", size, {"format": output_format}) for output_format, size in _output_bytes.items()]
+
+        lines += ["# HELP redo_db_round_trips_total Execute and fetch round trips to the database", "# TYPE redo_db_round_trips_total counter"]
+        lines.append(_line("redo_db_round_trips_total", _counters["db_round_trips"]))
+        lines += ["# HELP redo_db_rows_fetched_total Rows fetched from the database", "# TYPE redo_db_rows_fetched_total counter"]
+        lines.append(_line("redo_db_rows_fetched_total", _counters["db_rows_fetched"]))
+        lines += ["# HELP redo_requests_in_flight Redo requests being processed now", "# TYPE redo_requests_in_flight gauge"]
+        lines.append(_line("redo_requests_in_flight", _counters["requests_in_flight"]))
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        if isinstance(value, dict):
+            lines += [_line(name, sample, dict(labels)) for labels, sample in value.items()]
+        else:
+            lines.append(_line(name, value))
+    return "\n".join(lines) + "\n"
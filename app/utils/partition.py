@@ -0,0 +1,209 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+from app.db.schema import concatInput
+
+# Fetch order of every ticket, used to put the partitioned output back in the order of the in-memory path
+SEQ_COLUMN = "_ROWSEQ"
+
+
+def partitionOf(serials, partitions):
+    """Partition number of each SERIALNO. Numbers are hashed as floats so batches where a numeric
+    serial column has different integer widths, or is float because of NULLs, hash alike."""
+    if pd.api.types.is_numeric_dtype(serials):
+        serials = serials.astype("float64")
+    hashes = pd.util.hash_pandas_object(serials, index=False).to_numpy()
+    return (hashes % np.uint64(partitions)).astype("int64")
+
+
+def _dumpFrames(path, df, chunk_rows):
+    # Appends df to a pickle stream in chunks so it can be read back a chunk at a time
+    with open(path, "ab") as file:
+        for start in range(0, len(df), chunk_rows):
+            pickle.dump(df.iloc[start:start + chunk_rows], file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _loadFrames(path):
+    with open(path, "rb") as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+def _isNull(series):
+    return series.dtype == object and series.isna().all()
+
+
+class TicketPartitions:
+    """Tickets spilled to disk by SERIALNO hash, so every serial with its whole ticket history
+    lands in one partition and the redo detection of a partition doesn't need the others"""
+
+    def __init__(self, partitions, directory):
+        self.partitions = partitions
+        self.directory = directory
+        self.rows = 0
+
+    def _path(self, partition):
+        return os.path.join(self.directory, f"input-{partition}.pkl")
+
+    def append(self, df):
+        """Spill one fetched batch. Batches must be appended in fetch order."""
+        if df.empty:
+            return
+        df[SEQ_COLUMN] = np.arange(self.rows, self.rows + len(df), dtype="int64")
+        self.rows += len(df)
+        partition = partitionOf(df["SERIALNO"], self.partitions)
+        for number in np.unique(partition):
+            _dumpFrames(self._path(number), df[partition == number], len(df))
+
+    def load(self, partition):
+        """Tickets of one partition in fetch order, or None when it is empty. The spill file is removed."""
+        path = self._path(partition)
+        if not os.path.exists(path):
+            return None
+        try:
+            return concatInput(list(_loadFrames(path)))
+        finally:
+            os.remove(path)
+
+
+class PartitionedResult:
+    """Redo output of a partitioned run, kept on disk a partition at a time. It is read back
+    in the row order of the in-memory path by merging the partitions on SEQ_COLUMN.
+    The spill directory is removed with the object."""
+
+    def __init__(self, partitions):
+        if settings.partition_dir:
+            os.makedirs(settings.partition_dir, exist_ok=True)
+        self._tmp = tempfile.TemporaryDirectory(prefix="redo-", dir=settings.partition_dir or None)
+        self.directory = self._tmp.name
+        self.input = TicketPartitions(partitions, self.directory)
+        self._outputs = []
+        self._columns = None
+        self._dtypes = {}
+        self._nulls = {}
+        self._categories = {}
+        self._rows = 0
+        self._chunk_rows = max(1000, settings.export_batch_rows // partitions)
+
+    def __getstate__(self):
+        # Process pool workers only read the spill files, the directory stays owned by this process
+        state = self.__dict__.copy()
+        state["_tmp"] = None
+        return state
+
+    def close(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    def append(self, partition, df):
+        """Store the merged output of one partition"""
+        if self._columns is None:
+            self._columns = [column for column in df.columns if column != SEQ_COLUMN]
+        for column in self._columns:
+            series = df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                categories = series.cat.categories
+                known = self._categories.setdefault(column, categories)
+                self._categories[column] = known.append(categories[~categories.isin(known)])
+            elif _isNull(series):
+                self._nulls.setdefault(column, series.dtype)
+            else:
+                self._dtypes.setdefault(column, set()).add(series.dtype)
+        path = os.path.join(self.directory, f"output-{partition}.pkl")
+        _dumpFrames(path, df, self._chunk_rows)
+        self._outputs.append(path)
+        self._rows += len(df)
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def columns(self):
+        return pd.Index(self._columns or [])
+
+    def _dtype(self, column):
+        # The dtype pd.concat would give the column of the in-memory path
+        if column in self._categories:
+            return pd.CategoricalDtype(self._categories[column])
+        dtypes = self._dtypes.get(column)
+        if not dtypes:
+            return self._nulls.get(column, np.dtype(object))
+        if len(dtypes) == 1:
+            return next(iter(dtypes))
+        if all(isinstance(dtype, np.dtype) and dtype.kind in "iuf" for dtype in dtypes):
+            return np.result_type(*dtypes)
+        return np.dtype(object)
+
+    def _cast(self, df):
+        df = df.drop(columns=SEQ_COLUMN)
+        for column in df.columns:
+            dtype = self._dtype(column)
+            if df[column].dtype != dtype:
+                if pd.api.types.is_integer_dtype(dtype) and df[column].isna().any():
+                    dtype = "float64"
+                df[column] = df[column].astype(dtype)
+        return df
+
+    def emptyFrame(self):
+        """Frame with the columns and dtypes of the output and no rows"""
+        return pd.DataFrame({column: pd.Series(dtype=self._dtype(column)) for column in self._columns or []})
+
+    def iterFrames(self, batch_rows=None):
+        """Output frames of at most batch_rows rows in fetch order. At most one chunk per
+        partition is held in memory: the rows up to the smallest last sequence number of the
+        chunks are emitted, since no row still on disk can come before them."""
+        batch_rows = batch_rows or settings.export_batch_rows
+        readers = [_loadFrames(path) for path in self._outputs]
+        buffers = [None] * len(readers)
+        while True:
+            for i, reader in enumerate(readers):
+                if reader is not None and (buffers[i] is None or buffers[i].empty):
+                    buffers[i] = next(reader, None)
+                    if buffers[i] is None:
+                        readers[i] = None
+            active = [i for i, buffer in enumerate(buffers) if buffer is not None and not buffer.empty]
+            if not active:
+                return
+            open_buffers = [buffers[i] for i in active if readers[i] is not None]
+            cutoff = min(buffer[SEQ_COLUMN].iloc[-1] for buffer in open_buffers) if open_buffers else None
+
+            parts = []
+            for i in active:
+                taken = len(buffers[i]) if cutoff is None else np.searchsorted(buffers[i][SEQ_COLUMN].to_numpy(), cutoff, side="right")
+                if taken:
+                    parts.append(buffers[i].iloc[:taken])
+                    buffers[i] = buffers[i].iloc[taken:]
+            merged = pd.concat([self._cast(part) for part in parts], ignore_index=False)
+            merged = merged.iloc[np.argsort(np.concatenate([part[SEQ_COLUMN].to_numpy() for part in parts]), kind="stable")]
+            merged = merged.reset_index(drop=True)
+            for start in range(0, len(merged), batch_rows):
+                yield merged.iloc[start:start + batch_rows]
+
+    def toFrame(self):
+        """Whole output in memory, for writers that can't stream"""
+        frames = list(self.iterFrames())
+        if not frames:
+            return self.emptyFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+def iterBatches(data, batch_rows):
+    """Frames of at most batch_rows rows of a DataFrame or a PartitionedResult"""
+    if isinstance(data, PartitionedResult):
+        yield from data.iterFrames(batch_rows)
+        return
+    for start in range(0, len(data), batch_rows):
+        yield data.iloc[start:start + batch_rows]
+
+
+def emptyFrame(data):
+    """Columns and dtypes of a DataFrame or a PartitionedResult, without rows"""
+    if isinstance(data, PartitionedResult):
+        return data.emptyFrame()
+    return data.iloc[:0]
@@ -1,9 +1,14 @@
 import pandas as pd
+import numpy as np
 from datetime import date, timedelta, datetime
 import re
 import io
 import base64
+import tempfile
 import asyncio
+from app.core.config import settings
+from app.utils.excel import writeExcel
+from app.utils.executor import runCpu
 
 def validateDateFormat(date_string):
     """Validate that date string matches YYYY-MM-DD format"""
@@ -11,63 +16,194 @@ def validateDateFormat(date_string):
     return bool(re.match(pattern, date_string))
 
 
-async def mainFilter(df):
-    # Run in thread pool since it's CPU-intensive
-    def _filter():
-        # Combine all filters into one operation
-        mask = (
-            (df['SERVICETYPE'] == "IH") & 
-            (df['WARRANTYSTATUS'].isin(['IW', 'YES', 'POP'])) &
-            (df['STATUS'] == 60)
-        )
-        filtered_df = df[mask]
-        
-        # Convert dates once
-        date_columns = ['COMPLETEDATE', 'ASSIGNDATE']
-        filtered_df[date_columns] = filtered_df[date_columns].astype('datetime64[ns]')
-        
-        filtered_df['WEEK'] = filtered_df['COMPLETEDATE'].dt.isocalendar().week
-        return filtered_df
+def _filter(df):
+    # Combine all filters into one operation
+    mask = (
+        (df['SERVICETYPE'] == "IH") & 
+        (df['WARRANTYSTATUS'].isin(['IW', 'YES', 'POP'])) &
+        (df['STATUS'] == 60)
+    )
+    # Boolean indexing already returns a new frame. The shallow copy drops its view flag so
+    # WEEK can be added without pandas copying the whole frame again.
+    filtered_df = df[mask].copy(deep=False)
     
-    return await asyncio.to_thread(_filter)
-
-
-async def processData(df, serial):
-    # Run in thread pool since it's CPU-intensive
-    def _process():
-        # Vectorized approach instead of loops
-        df['REDO_CHECK'] = None
-        
-        # Group by serial number for faster processing
-        grouped = df.groupby('SERIALNO')
-        
-        for k in serial:
-            serial_data = grouped.get_group(k) if k in grouped.groups else pd.DataFrame()
-            if serial_data.empty:
-                continue
-                
-            serial_data = serial_data.sort_values('TICKETNO', ascending=False)
-            
-            # Vectorized date comparison
-            check_date = serial_data['ASSIGNDATE'].iloc[0]
-            redo_check = check_date - timedelta(days=90)
-            mask = (serial_data['COMPLETEDATE'] >= redo_check) & (serial_data['COMPLETEDATE'] < check_date)
-            
-            if mask.any():
-                # Use shift to get next ticket number without loop
-                df.loc[serial_data.index, 'REDO_CHECK'] = serial_data['TICKETNO'].shift(-1)
-        
-        return df
+    # Dates are parsed at fetch time (see app.db.schema), convert only frames that still hold strings
+    for column in ('COMPLETEDATE', 'ASSIGNDATE'):
+        if not pd.api.types.is_datetime64_any_dtype(filtered_df[column]):
+            filtered_df[column] = filtered_df[column].astype('datetime64[ns]')
     
-    return await asyncio.to_thread(_process)
+    filtered_df['WEEK'] = filtered_df['COMPLETEDATE'].dt.isocalendar().week
+    return filtered_df
+
+
+async def mainFilter(df):
+    # Run in thread or process pool since it's CPU-intensive
+    return await runCpu(_filter, df)
+
+
+def _processLoop(df, serial, lookback_days=90):
+    """Per-serial redo detection, kept as the reference implementation for testRedoParity"""
+    df['REDO_CHECK'] = None
+
+    # Group by serial number for faster processing
+    grouped = df.groupby('SERIALNO')
+
+    for k in serial:
+        serial_data = grouped.get_group(k) if k in grouped.groups else pd.DataFrame()
+        if serial_data.empty:
+            continue
+
+        serial_data = serial_data.sort_values('TICKETNO', ascending=False)
+
+        # Vectorized date comparison
+        check_date = serial_data['ASSIGNDATE'].iloc[0]
+        redo_check = check_date - timedelta(days=lookback_days)
+        mask = (serial_data['COMPLETEDATE'] >= redo_check) & (serial_data['COMPLETEDATE'] < check_date)
+
+        if mask.any():
+            # Use shift to get next ticket number without loop
+            df.loc[serial_data.index, 'REDO_CHECK'] = serial_data['TICKETNO'].shift(-1)
+
+    return df
+
+
+def _processVectorized(df, lookback_days=90):
+    """Compute REDO_CHECK for all serials in one pass: a global sort on (SERIALNO, TICKETNO)
+    followed by shifted and grouped NumPy operations"""
+    redo_check = np.full(len(df), np.nan)
+
+    # Rows without a serial number never belong to a group
+    positions = np.flatnonzero(df['SERIALNO'].notna().to_numpy())
+    if len(positions) == 0:
+        df['REDO_CHECK'] = redo_check
+        return df
+
+    codes = pd.factorize(df['SERIALNO'].to_numpy()[positions])[0]
+    tickets = df['TICKETNO'].to_numpy()[positions]
+
+    # Stable sort by serial, then ticket ascending - the latest ticket of a serial is its last row
+    order = np.lexsort((tickets, codes))
+    codes = codes[order]
+    tickets = tickets[order].astype('float64')
+    assign = df['ASSIGNDATE'].to_numpy(dtype='datetime64[ns]')[positions][order]
+    complete = df['COMPLETEDATE'].to_numpy(dtype='datetime64[ns]')[positions][order]
+
+    # Check date of each serial is the assign date of its latest ticket
+    is_last = np.append(codes[1:] != codes[:-1], True)
+    check_date = np.empty(codes[-1] + 1, dtype='datetime64[ns]')
+    check_date[codes[is_last]] = assign[is_last]
+    row_check = check_date[codes]
+
+    in_window = (complete >= row_check - np.timedelta64(lookback_days, 'D')) & (complete < row_check)
+    has_redo = np.bincount(codes[in_window], minlength=len(check_date)) > 0
+
+    # Each ticket is paired with the previous ticket of the same serial
+    previous = np.empty(len(tickets))
+    previous[0] = np.nan
+    previous[1:] = tickets[:-1]
+    previous[np.append(True, codes[1:] != codes[:-1])] = np.nan
+
+    redo_check[positions[order]] = np.where(has_redo[codes], previous, np.nan)
+    df['REDO_CHECK'] = redo_check
+    return df
+
+
+async def processData(df, lookback_days=None):
+    # Run in thread or process pool since it's CPU-intensive
+    if lookback_days is None:
+        lookback_days = settings.redo_lookback_days
+
+    return await runCpu(_processVectorized, df, lookback_days)
+
+def _processSlices(df, slices, lookback_days=90):
+    """Redo detection on row subsets of a filtered frame, each on its own as if it had been fetched
+    alone. slices are (accounts, start_date, end_date, include_end) tuples selecting the rows of
+    accounts (every account when empty) completed from start_date up to end_date. COMPLETEDATE has
+    no time of day, so like the date shards a slice that isn't include_end leaves its end date out."""
+    codes, values = pd.factorize(df['ACCOUNTNO'])
+    values = pd.Index(values).astype(str)
+    complete = df['COMPLETEDATE'].to_numpy()
+
+    frames = []
+    for accounts, start_date, end_date, include_end in slices:
+        mask = complete >= np.datetime64(start_date)
+        mask &= (complete <= np.datetime64(end_date)) if include_end else (complete < np.datetime64(end_date))
+        if accounts:
+            # Code -1 is a missing account number and picks the appended False
+            mask &= np.append(values.isin([str(x) for x in accounts]), False)[codes]
+        frames.append(_processVectorized(df[mask].copy(deep=False), lookback_days))
+    return frames
+
+
+async def processSlices(df, slices, lookback_days=None):
+    """processData for every slice of df in one stage, see _processSlices"""
+    if lookback_days is None:
+        lookback_days = settings.redo_lookback_days
+
+    return await runCpu(_processSlices, df, slices, lookback_days)
+
+# KPI dimension -> (key column, label column)
+KPI_DIMENSIONS = {
+    "tech": ("TECHID", "TECHNAME"),
+    "warehouse": ("NICKNAME", None),
+    "brand": ("BRAND", None),
+    "productType": ("PRODUCTTYPE", None),
+    "month": ("COMPLETEMONTH", None),
+    "week": ("WEEK", None),
+}
+
+
+def _kpiRows(redo, keys, labels=None):
+    grouped = redo.groupby(keys, observed=True, sort=True, dropna=False).agg(['size', 'sum'])
+    if labels is not None:
+        labels = labels.groupby(keys, observed=True, sort=True, dropna=False).first()
+    rows = []
+    for key, tickets, redos in zip(grouped.index.tolist(), grouped['size'].tolist(), grouped['sum'].tolist()):
+        row = {"key": None if pd.isna(key) else key, "tickets": tickets, "redos": redos, "redoRate": redos / tickets}
+        if labels is not None:
+            row["name"] = None if pd.isna(labels.get(key)) else labels.get(key)
+        rows.append(row)
+    return rows
+
+
+def _redoKpis(df, dimensions):
+    """Redo count, completed tickets and redo rate overall and per dimension of KPI_DIMENSIONS.
+    A ticket counts as a redo when it is paired with an earlier ticket, the rows with REDOTKTNO
+    in the merged output. df is the processData frame, or the redoServerSide output."""
+    redo = (df['REDO_CHECK'] if 'REDO_CHECK' in df.columns else df['REDOTKTNO']).notna()
+    tickets = len(redo)
+    redos = int(redo.sum())
+    result = {
+        "total": {"tickets": tickets, "redos": redos, "redoRate": redos / tickets if tickets else None},
+        "dimensions": {},
+    }
+    for dimension in dimensions:
+        column, label = KPI_DIMENSIONS[dimension]
+        if dimension == "week":
+            # Grouped by ISO year * 100 + week so weeks of different years don't add up
+            calendar = df['COMPLETEDATE'].dt.isocalendar()
+            rows = _kpiRows(redo, calendar['year'] * 100 + calendar['week'])
+            for row in rows:
+                if row["key"] is not None:
+                    row["key"] = f"{row['key'] // 100}-W{row['key'] % 100:02d}"
+        else:
+            # The redoServerSide output names the ticket's tech TECHID_x
+            keys = df[column if column in df.columns else f"{column}_x"]
+            rows = _kpiRows(redo, keys, df[label] if label else None)
+        result["dimensions"][dimension] = rows
+    return result
+
+
+async def redoKpis(df, dimensions):
+    # Run in thread or process pool, the group-bys scan the whole frame
+    return await runCpu(_redoKpis, df, dimensions)
+
+def _merge(filtered_df, redo_df):
+    return pd.merge(filtered_df, redo_df, how='left', left_on='REDO_CHECK', right_on='REDOTKTNO')
 
 async def mergeWithRedo(filtered_df, redo_df):
-    # Run in thread pool since pandas merge can be CPU-intensive
-    def _merge():
-        result = pd.merge(filtered_df, redo_df, how='left', left_on='REDO_CHECK', right_on='REDOTKTNO')
-        return result
-    
-    return await asyncio.to_thread(_merge)
+    # Run in thread or process pool since pandas merge can be CPU-intensive
+    return await runCpu(_merge, filtered_df, redo_df)
     
 def testDateValidation():
     assert validateDateFormat("2024-01-15") == True
@@ -75,18 +211,60 @@ def testDateValidation():
     assert validateDateFormat("'; DROP TABLE--") == False  # SQL injection attempt
     assert validateDateFormat("2024-01-32") == False  # Invalid date
 
+def testRedoParity():
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({
+        'SERIALNO': rng.choice([f'SN{i}' for i in range(800)] + [None], n),
+        'TICKETNO': rng.permutation(n) + 4000000000,
+        'ASSIGNDATE': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+        'COMPLETEDATE': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+    })
+    for lookback_days in (30, 90):
+        expected = _processLoop(df.copy(), list(df['SERIALNO'].dropna().unique()), lookback_days)['REDO_CHECK']
+        actual = _processVectorized(df.copy(), lookback_days)['REDO_CHECK']
+        assert (expected.isna() == actual.isna()).all()
+        assert (expected.dropna().astype('int64') == actual.dropna().astype('int64')).all()
+
+
+
+def _generateExcelBase64(df):
+    buffer = io.BytesIO()
+    writeExcel(df, buffer)
+
+    buffer.seek(0)
+    encoded = base64.b64encode(buffer.read()).decode("utf-8")
+
+    return {"filename": "redo_output.xlsx", "file": encoded}
 
 
 async def getExcelBase64(df):
-    # Run in thread pool since Excel generation is I/O intensive
+    # Run in thread or process pool since Excel generation is CPU intensive
+    return await runCpu(_generateExcelBase64, df)
+
+
+async def getExcelFile(df):
+    # Write to a spooled temp file so large workbooks go to disk instead of staying in memory
     def _generate_excel():
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Sheet1")
+        file = tempfile.SpooledTemporaryFile(max_size=settings.excel_spool_max_size)
+        try:
+            writeExcel(df, file)
 
-        buffer.seek(0)
-        encoded = base64.b64encode(buffer.read()).decode("utf-8")
+            size = file.seek(0, io.SEEK_END)
+            file.seek(0)
+        except Exception:
+            file.close()
+            raise
 
-        return {"filename": "redo_output.xlsx", "file": encoded}
-    
-    return await asyncio.to_thread(_generate_excel)
\ No newline at end of file
+        return file, size
+
+    return await asyncio.to_thread(_generate_excel)
+
+
+def iterFile(file, chunk_size=1024 * 1024):
+    """Yield a file in chunks and close it once it has been read"""
+    try:
+        while chunk := file.read(chunk_size):
+            yield chunk
+    finally:
+        file.close()
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# key -> task of the computation currently in flight
+_inflight = {}
+# key -> counters, least recently used first
+_stats = OrderedDict()
+
+
+def _keyStats(key):
+    stats = _stats.get(key)
+    if stats is None:
+        stats = {"calls": 0, "executions": 0, "shared": 0, "errors": 0}
+        _stats[key] = stats
+        while len(_stats) > settings.singleflight_max_keys:
+            _stats.popitem(last=False)
+    else:
+        _stats.move_to_end(key)
+    return stats
+
+
+def _finished(key, task):
+    _inflight.pop(key, None)
+    # Retrieve the exception so it's counted even when every waiter has gone away
+    if not task.cancelled() and task.exception() is not None:
+        _keyStats(key)["errors"] += 1
+
+
+async def singleFlight(key, fn):
+    """Await fn() once for all concurrent callers with the same key.
+    Every caller gets the same result or the same exception. The computation runs as its
+    own task, so a caller that disconnects doesn't cancel it for the others."""
+    stats = _keyStats(key)
+    stats["calls"] += 1
+    task = _inflight.get(key)
+    if task is None:
+        stats["executions"] += 1
+        task = asyncio.create_task(fn())
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _finished(key, done))
+    else:
+        stats["shared"] += 1
+        logger.info("Joining in-flight computation for %s", key)
+    return await asyncio.shield(task)
+
+
+def getSingleFlightStats():
+    return {
+        "in_flight": len(_inflight),
+        "keys": {key: {**stats, "in_flight": key in _inflight} for key, stats in _stats.items()},
+    }
@@ -0,0 +1,50 @@
+"""Compare the Excel writer engines on a synthetic redo output frame.
+
+Each engine runs in its own process so peak RSS is measured per engine.
+
+    python -m benchmarks.bench_excel --rows 200000
+"""
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from benchmarks.synthetic import makeRedoOutput
+
+
+def _run(engine, rows, queue):
+    from app.utils.excel import writeExcel
+
+    df = makeRedoOutput(rows)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryFile() as file:
+        start = time.perf_counter()
+        writeExcel(df, file, engine)
+        elapsed = time.perf_counter() - start
+        size = file.tell()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((elapsed, size, baseline / 1024, peak / 1024))
+
+
+def main():
+    from app.utils.excel import EXCEL_ENGINES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--engines', nargs='+', default=list(EXCEL_ENGINES), choices=EXCEL_ENGINES)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'engine':<12}{'seconds':>10}{'rows/s':>12}{'MB out':>10}{'RSS before MB':>15}{'peak RSS MB':>13}")
+    for engine in args.engines:
+        queue = context.Queue()
+        process = context.Process(target=_run, args=(engine, args.rows, queue))
+        process.start()
+        elapsed, size, baseline, peak = queue.get()
+        process.join()
+        print(f"{engine:<12}{elapsed:>10.2f}{args.rows / elapsed:>12.0f}{size / 1e6:>10.1f}{baseline:>15.0f}{peak:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
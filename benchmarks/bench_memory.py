@@ -0,0 +1,85 @@
+"""Compare the memory of the redo pipeline with object columns, with the extraction schema and partitioned.
+
+The ticket list is built in shards, like the sharded redoInput fetch, and then runs through
+mainFilter and processData. The partitioned variant spills the shards by SERIALNO hash and runs
+the stages one partition at a time. Each variant runs in its own process so peak RSS is measured per variant.
+
+    python -m benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+import pandas as pd
+from benchmarks.synthetic import makeRedoInput
+
+VARIANTS = ("object", "schema", "partitioned")
+
+
+def _rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(variant, rows, shards, partitions, queue):
+    from app.db.schema import applyInputSchema, concatInput
+    from app.utils.process import _filter, _processVectorized
+    from app.utils.partition import PartitionedResult
+
+    baseline = _rss()
+    start = time.perf_counter()
+    shard_rows = -(-rows // shards)
+    frames = []
+    result = PartitionedResult(partitions) if variant == "partitioned" else None
+    for shard in range(shards):
+        df = makeRedoInput(min(shard_rows, rows - shard * shard_rows), seed=shard)
+        if variant == "object":
+            frames.append(df)
+        elif variant == "schema":
+            frames.append(applyInputSchema(df))
+        else:
+            result.input.append(applyInputSchema(df))
+        del df
+
+    if variant == "partitioned":
+        # Largest partition frame stands in for the frame size
+        input_bytes = 0
+        fetched = _rss()
+        for partition in range(partitions):
+            df = result.input.load(partition)
+            if df is not None:
+                input_bytes = max(input_bytes, df.memory_usage(index=True, deep=True).sum())
+                df = _processVectorized(_filter(df))
+            del df
+        result.close()
+    else:
+        df = concatInput(frames) if variant == "schema" else pd.concat(frames, ignore_index=True)
+        del frames
+        input_bytes = df.memory_usage(index=True, deep=True).sum()
+        fetched = _rss()
+        df = _processVectorized(_filter(df))
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, input_bytes / 2**20, baseline, fetched, _rss()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--shards', type=int, default=12)
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'variant':<10}{'seconds':>10}{'frame MB':>10}{'RSS before MB':>15}{'fetched RSS MB':>16}{'peak RSS MB':>13}")
+    for variant in args.variants:
+        queue = context.Queue()
+        process = context.Process(target=_run, args=(variant, args.rows, args.shards, args.partitions, queue))
+        process.start()
+        elapsed, frame, baseline, fetched, peak = queue.get()
+        process.join()
+        print(f"{variant:<10}{elapsed:>10.2f}{frame:>10.1f}{baseline:>15.0f}{fetched:>16.0f}{peak:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
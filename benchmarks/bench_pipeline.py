@@ -0,0 +1,270 @@
+"""Per-stage throughput and peak memory of the redo pipeline on synthetic data.
+
+Synthetic opticket, opbase, nspusers and nspwarehouses tables (benchmarks.synthetic) are written to
+a SQLite file that stands in for Oracle (benchmarks.localdb), and a report over the whole range
+runs through the stages of /redo/single: redoInput, mainFilter, processData, redoOutput,
+mergeWithRedo and getExcelBase64. The stages are timed over --repeat runs and the fastest run is
+kept. Peak memory is the largest traced allocation of a stage, from one more run under tracemalloc
+so the tracing doesn't slow down the timed runs. The pipeline runs in its own process so peak RSS
+only counts the pipeline.
+
+    python -m benchmarks.bench_pipeline --serials 200000 --days 365
+    python -m benchmarks.bench_pipeline --save main
+    python -m benchmarks.bench_pipeline --compare main
+
+--save writes the results to benchmarks/baselines/<name>.json. --compare checks the results
+against a saved baseline and exits with status 1 when a stage got slower or uses more memory
+than the baseline by more than --tolerance. The baseline must have the same data parameters.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import queue as queues
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from functools import partial
+import numpy as np
+import pandas as pd
+from benchmarks.localdb import StandInConnection, writeTables
+from benchmarks.synthetic import makeTables
+
+STAGES = ("redoInput", "mainFilter", "processData", "redoOutput", "mergeWithRedo", "getExcelBase64")
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+# Differences below these are noise, whatever the tolerance
+MIN_SECONDS = 0.02
+MIN_PEAK_MB = 2.0
+
+
+class _Recorder:
+    """Seconds, rows and traced peak of every stage of one run"""
+
+    def __init__(self, traced):
+        self.traced = traced
+        self.stages = {}
+
+    @asynccontextmanager
+    async def stage(self, name):
+        result = {"rows": 0}
+        if self.traced:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield result
+        result["seconds"] = time.perf_counter() - start
+        if self.traced:
+            result["peak_mb"] = (tracemalloc.get_traced_memory()[1] - before) / 2**20
+        self.stages[name] = result
+
+
+async def _pipeline(path, start_date, end_date, recorder):
+    from app.db.queries import redoInput, redoOutput
+    from app.utils.process import mainFilter, processData, mergeWithRedo, getExcelBase64
+
+    connection = StandInConnection(path)
+    try:
+        async with recorder.stage("redoInput") as stage:
+            df = await redoInput(start_date, end_date, [], connection)
+            stage["rows"] = len(df)
+        async with recorder.stage("mainFilter") as stage:
+            stage["rows"] = len(df)
+            df = await mainFilter(df)
+        async with recorder.stage("processData") as stage:
+            stage["rows"] = len(df)
+            filtered_df = await processData(df)
+        del df
+        tickets = tuple(f'{x}' for x in filtered_df['REDO_CHECK'].dropna().astype(int))
+        async with recorder.stage("redoOutput") as stage:
+            output = await redoOutput(tickets, start_date, end_date, connection)
+            stage["rows"] = len(output)
+        async with recorder.stage("mergeWithRedo") as stage:
+            stage["rows"] = len(filtered_df)
+            redo_output_df = await mergeWithRedo(filtered_df, output)
+        del filtered_df, output
+        redo_output_df.drop('REDO_CHECK', axis=1, inplace=True)
+        async with recorder.stage("getExcelBase64") as stage:
+            stage["rows"] = len(redo_output_df)
+            await getExcelBase64(redo_output_df)
+    finally:
+        connection.close()
+
+
+def _run(path, start_date, end_date, repeat, queue):
+    import app.db.queries
+    from app.core.config import settings
+
+    # Every run reads the database, and the extra shard connections open the stand-in too
+    settings.cache_enabled = False
+    app.db.queries.getConnection = partial(StandInConnection, path)
+
+    stages = {}
+    for _ in range(repeat):
+        recorder = _Recorder(traced=False)
+        asyncio.run(_pipeline(path, start_date, end_date, recorder))
+        for name, result in recorder.stages.items():
+            if name not in stages or result["seconds"] < stages[name]["seconds"]:
+                stages[name] = result
+
+    tracemalloc.start()
+    recorder = _Recorder(traced=True)
+    asyncio.run(_pipeline(path, start_date, end_date, recorder))
+    tracemalloc.stop()
+    for name, result in recorder.stages.items():
+        stages[name]["peak_mb"] = result["peak_mb"]
+        stages[name]["rows_per_second"] = stages[name]["rows"] / stages[name]["seconds"]
+
+    # ru_maxrss is in kilobytes on Linux
+    queue.put({
+        "stages": stages,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "excel_engine": settings.excel_engine,
+    })
+
+
+def _prepare(path, params):
+    """Write the synthetic tables to path unless it already holds tables made with params"""
+    if os.path.exists(path):
+        connection = sqlite3.connect(path)
+        try:
+            stored = connection.execute("SELECT value FROM bench_params").fetchone()
+        except sqlite3.Error:
+            stored = None
+        finally:
+            connection.close()
+        if stored and json.loads(stored[0]) == params:
+            print(f"Reusing {path}")
+            return
+        os.remove(path)
+
+    start = time.perf_counter()
+    tables = makeTables(**params)
+    writeTables(tables, path)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE bench_params (value TEXT)")
+        connection.execute("INSERT INTO bench_params VALUES (?)", (json.dumps(params),))
+    connection.close()
+    print(f"Generated {len(tables['opticket'])} tickets in {time.perf_counter() - start:.1f}s")
+
+
+def _compare(results, baseline, tolerance):
+    """Stages that regressed against baseline, as printable lines"""
+    regressions = []
+    for name, result in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > MIN_SECONDS:
+            regressions.append(f"{name}: {result['seconds']:.3f}s, baseline {base['seconds']:.3f}s")
+        if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) and result["peak_mb"] - base["peak_mb"] > MIN_PEAK_MB:
+            regressions.append(f"{name}: peak {result['peak_mb']:.1f} MB, baseline {base['peak_mb']:.1f} MB")
+    return regressions
+
+
+def _change(value, base):
+    if not base:
+        return ""
+    return f"{(value / base - 1) * 100:+.0f}%"
+
+
+def _receive(process, queue, poll_seconds=5):
+    """Results the benchmark process puts on queue. Exits with the status of the process when it
+    ends without them, an import error or a crash, instead of waiting forever."""
+    while True:
+        try:
+            return queue.get(timeout=poll_seconds)
+        except queues.Empty:
+            if process.is_alive():
+                continue
+        # The results may have been put right before the process ended
+        try:
+            return queue.get(timeout=1)
+        except queues.Empty:
+            process.join()
+            print(f"The benchmark process exited with status {process.exitcode} without results", file=sys.stderr)
+            sys.exit(process.exitcode if process.exitcode and process.exitcode > 0 else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serials', type=int, default=100000)
+    parser.add_argument('--repair-rate', type=float, default=0.15, help="probability of another visit after each visit")
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--db', help="SQLite file of the synthetic tables, kept and reused across runs")
+    parser.add_argument('--save', metavar='NAME', help="save the results as a baseline")
+    parser.add_argument('--compare', metavar='NAME', help="compare the results with a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown or memory growth, 0.15 is 15%%")
+    args = parser.parse_args()
+
+    params = {
+        'serials': args.serials, 'repair_rate': args.repair_rate, 'start_date': args.start_date,
+        'days': args.days, 'accounts': args.accounts, 'seed': args.seed,
+    }
+    # Reports cover the whole generated span
+    end_date = (date.fromisoformat(args.start_date) + timedelta(days=args.days)).isoformat()
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as file:
+            baseline = json.load(file)
+        if baseline["params"] != params:
+            parser.error(f"baseline {args.compare} was run with {baseline['params']}")
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        path = args.db or os.path.join(directory, "tickets.sqlite")
+        _prepare(path, params)
+
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=_run, args=(path, args.start_date, end_date, args.repeat, queue))
+        process.start()
+        results = _receive(process, queue)
+        process.join()
+
+    results.update({
+        "params": params,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(), "machine": platform.machine(),
+            "pandas": pd.__version__, "numpy": np.__version__, "excel_engine": results.pop("excel_engine"),
+        },
+    })
+
+    print(f"{'stage':<16}{'seconds':>10}{'rows':>10}{'rows/s':>12}{'peak MB':>10}" + (f"{'time':>8}{'memory':>8}" if baseline else ""))
+    for name in STAGES:
+        result = results["stages"][name]
+        line = f"{name:<16}{result['seconds']:>10.3f}{result['rows']:>10}{result['rows_per_second']:>12.0f}{result['peak_mb']:>10.1f}"
+        if baseline and name in baseline["stages"]:
+            base = baseline["stages"][name]
+            line += f"{_change(result['seconds'], base['seconds']):>8}{_change(result['peak_mb'], base['peak_mb']):>8}"
+        print(line)
+    print(f"peak RSS {results['peak_rss_mb']:.0f} MB")
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{args.save}.json"), "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline {args.save}")
+
+    if baseline:
+        regressions = _compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
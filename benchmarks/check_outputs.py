@@ -0,0 +1,273 @@
+"""Consistency checks of the redo endpoints on synthetic data.
+
+Synthetic tables (benchmarks.synthetic) are written to a SQLite file that stands in for Oracle
+(benchmarks.localdb), and the app is called in-process through FastAPI's TestClient with its
+database connections opened on the stand-in. Every check compares two ways of producing the
+same report and prints OK or FAIL; the script exits with status 1 when a check fails.
+
+    python -m benchmarks.check_outputs --serials 20000 --days 180
+
+Checks:
+    rows-partitioned    /redo/rows pages of a partitioned run equal those of the in-memory run
+    sql-parity          mode 'sql' (redoServerSide) returns the same rows as mode 'pandas'
+                        (mainFilter, processData, redoOutput, mergeWithRedo) for several lookbacks,
+                        on the synthetic tickets plus serials revisited right at the lookback edges
+    gather-failure      when a shard or chunk query fails, gatherPooled raises only after the
+                        last query on the request's connection has returned
+    accept-format       formatFromAccept picks the top-ranked media range by q-value and never
+                        a refused (q=0) one
+"""
+import argparse
+import asyncio
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from functools import partial
+import pandas as pd
+from benchmarks.localdb import StandInConnection, writeTables
+from benchmarks.synthetic import makeTables
+
+# Settings are read when the app is imported, the stand-in doesn't use the credentials
+for _name in ("DB_USER", "DB_PASSWORD", "DB_DSN", "SECRET_KEY"):
+    os.environ.setdefault(_name, "check")
+
+HEADERS = {"X-API-Key": os.environ["SECRET_KEY"]}
+LOOKBACKS = (1, 30, 90)
+# Days between the completion of a visit and the assign of the revisit, relative to the lookback
+EDGE_OFFSETS = (-1, 0, 1)
+
+
+def _client(path):
+    """TestClient of the app with every getConnection of the app opening the stand-in at path"""
+    from fastapi.testclient import TestClient
+    from app.core.config import settings
+    import app.main
+
+    settings.log_file = ""
+    settings.log_level = "WARNING"
+    settings.cache_enabled = False
+    settings.index_enabled = False
+    connect = partial(StandInConnection, path)
+    for name, module in list(sys.modules.items()):
+        if name.startswith("app.") and hasattr(module, "getConnection"):
+            module.getConnection = connect
+    app.main.createPool = lambda: None
+    app.main.closePool = lambda: None
+    return TestClient(app.main.app)
+
+
+def _pages(client, body):
+    """Every row of /redo/rows for body, page by page"""
+    from app.core.config import settings
+
+    rows, after = [], None
+    while True:
+        body = {**body, "pageSize": settings.rows_max_page_size, "after": after}
+        response = client.post("/redo/rows", json=body, headers=HEADERS)
+        response.raise_for_status()
+        page = response.json()
+        rows += page["rows"]
+        after = page["nextAfter"]
+        if after is None:
+            return rows
+
+
+def checkRowsPartitioned(client, body):
+    from app.core.config import settings
+
+    # partitions isn't part of the cache key, so every page runs the pipeline again
+    ttl, settings.rows_ttl = settings.rows_ttl, 0
+    try:
+        partitioned = _pages(client, {**body, "partitions": 4})
+        in_memory = _pages(client, {**body, "partitions": 0})
+    finally:
+        settings.rows_ttl = ttl
+    if not in_memory or partitioned != in_memory:
+        return f"{len(partitioned)} partitioned rows, {len(in_memory)} in-memory rows"
+    return None
+
+
+def addLookbackEdges(path, start_date, days):
+    """Add serials with a revisit assigned exactly lookback - 1, lookback and lookback + 1 days
+    after the completion of the first visit for every lookback in LOOKBACKS, plus a same-day
+    revisit. The timestamps carry a time of day, so the day truncation is exercised too."""
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        template = dict(connection.execute(
+            """SELECT t.* FROM opticket t JOIN opbase b ON b.id = t.id
+            WHERE t.vendorid = 1 AND t.systemid = 2 AND t.servicetype = 'IH'
+            AND t.warrantystatus = 'IW' AND b.status = 60 LIMIT 1"""
+        ).fetchone())
+        ticket = connection.execute("SELECT MAX(ticketno) FROM opticket").fetchone()[0]
+        first_completed = pd.Timestamp(start_date) + pd.Timedelta(days=(days - max(LOOKBACKS)) // 2, hours=10)
+        gaps = sorted({0} | {lookback + offset for lookback in LOOKBACKS for offset in EDGE_OFFSETS if lookback + offset >= 0})
+        rows = []
+        for gap in gaps:
+            revisit = first_completed.normalize() + pd.Timedelta(days=gap, hours=15)
+            for assigned, completed in ((first_completed - pd.Timedelta(days=1), first_completed), (revisit, revisit + pd.Timedelta(hours=2))):
+                ticket += 1
+                rows.append({
+                    **template,
+                    "TICKETNO": ticket,
+                    "SERIALNO": f"EDGE{gap}",
+                    "ASSIGNDTIME": assigned.strftime('%Y-%m-%d %H:%M:%S'),
+                    "COMPLETEDTIME": completed.strftime('%Y-%m-%d %H:%M:%S'),
+                })
+        columns = list(rows[0])
+        with connection:
+            connection.executemany(
+                f"INSERT INTO opticket ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [tuple(row[column] for column in columns) for row in rows]
+            )
+    finally:
+        connection.close()
+
+
+def _report(client, body):
+    response = client.post("/redo/single", json={**body, "format": "parquet", "partitions": 0}, headers=HEADERS)
+    response.raise_for_status()
+    return pd.read_parquet(io.BytesIO(response.content)).sort_values("TICKETNO", ignore_index=True)
+
+
+def _difference(expected, actual):
+    """First difference between two reports, None when they hold the same values"""
+    if list(actual.columns) != list(expected.columns):
+        return f"columns {list(actual.columns)}, expected {list(expected.columns)}"
+    if len(actual) != len(expected):
+        return f"{len(actual)} rows, expected {len(expected)}"
+    for column in expected.columns:
+        left, right = expected[column], actual[column]
+        # The stand-in returns dates computed by the statement as text, Oracle as DATE
+        if pd.api.types.is_datetime64_any_dtype(left):
+            right = pd.to_datetime(right)
+        left, right = left.astype(object).where(left.notna()), right.astype(object).where(right.notna())
+        differs = (left.isna() != right.isna()) | (left.notna() & (left.astype(str) != right.astype(str)))
+        if differs.any():
+            row = differs.idxmax()
+            return f"{column} of ticket {expected['TICKETNO'][row]}: {right[row]!r}, expected {left[row]!r}"
+    return None
+
+
+def checkSqlParity(client, body):
+    for lookback_days in LOOKBACKS:
+        expected = _report(client, {**body, "mode": "pandas", "lookbackDays": lookback_days})
+        actual = _report(client, {**body, "mode": "sql", "lookbackDays": lookback_days})
+        problem = _difference(expected, actual)
+        if problem:
+            return f"lookback {lookback_days}: {problem}"
+        edges = expected[expected["SERIALNO"].astype(str).str.startswith("EDGE")]
+        if edges.empty or edges["REDOTKTNO"].notna().all():
+            return f"lookback {lookback_days}: the edge serials aren't in the report or don't cover both sides"
+    return None
+
+
+class _Session:
+    def close(self):
+        pass
+
+
+def checkGatherFailure(client, body):
+    from app.core.config import settings
+    import app.db.queries as queries
+
+    own, calls = _Session(), []
+    released = None
+
+    def _query(index, conn):
+        time.sleep(0.05)
+        calls.append((time.monotonic(), conn))
+        if index == 1:
+            raise RuntimeError("query failed")
+
+    async def _request():
+        nonlocal released
+        try:
+            await queries.gatherPooled(_query, [(index,) for index in range(12)], own)
+        except RuntimeError:
+            pass
+        else:
+            return "the error of the failed call wasn't raised"
+        # What the caller does next is giving the connection back to the pool
+        released = time.monotonic()
+        await asyncio.sleep(0.5)
+
+    saved = queries.getConnection, settings.db_pool_max, settings.db_parallel_queries
+    queries.getConnection, settings.db_pool_max, settings.db_parallel_queries = _Session, settings.admission_db_limit + 3, 2
+    try:
+        problem = asyncio.run(_request())
+    finally:
+        queries.getConnection, settings.db_pool_max, settings.db_parallel_queries = saved
+    if problem:
+        return problem
+    late = [at for at, conn in calls if conn is own and at > released]
+    if late:
+        return f"{len(late)} calls ran on the request's connection after gatherPooled returned"
+    if len(calls) >= 12:
+        return "the other workers kept taking calls after the failure"
+    return None
+
+
+# Accept header -> format formatFromAccept has to pick
+ACCEPT_CASES = {
+    "text/csv": "csv",
+    "application/json, text/csv;q=0.1": None,
+    "text/csv;q=0": None,
+    "text/csv;q=0, application/x-ndjson": "ndjson",
+    "text/csv;q=0.5, application/vnd.apache.parquet;q=0.9": "parquet",
+    "application/x-ndjson; q=0.8, text/csv;q=0.8": "ndjson",
+    "Text/CSV;Q=1.0, */*;q=0.1": "csv",
+    "*/*": None,
+}
+
+
+def checkAcceptFormat(client, body):
+    from app.utils.export import formatFromAccept
+
+    for accept, expected in ACCEPT_CASES.items():
+        actual = formatFromAccept(accept)
+        if actual != expected:
+            return f"{accept!r}: {actual!r}, expected {expected!r}"
+    return None
+
+
+CHECKS = {
+    "rows-partitioned": checkRowsPartitioned,
+    "sql-parity": checkSqlParity,
+    "gather-failure": checkGatherFailure,
+    "accept-format": checkAcceptFormat,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serials', type=int, default=20000)
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='append', choices=list(CHECKS), help="run only these checks")
+    args = parser.parse_args()
+
+    end_date = (date.fromisoformat(args.start_date) + timedelta(days=args.days)).isoformat()
+    body = {"startDate": args.start_date, "endDate": end_date, "accountNo": []}
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="check-") as directory:
+        path = os.path.join(directory, "tickets.sqlite")
+        writeTables(makeTables(serials=args.serials, start_date=args.start_date, days=args.days, seed=args.seed), path)
+        addLookbackEdges(path, args.start_date, args.days)
+        with _client(path) as client:
+            for name in args.check or CHECKS:
+                problem = CHECKS[name](client, body)
+                failed |= problem is not None
+                print(f"{'FAIL' if problem else 'OK':<6}{name}" + (f": {problem}" if problem else ""))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""SQLite stand-in for the Oracle database, so the query layer of app/db/queries.py can run locally.
+
+writeTables stores the synthetic tables of benchmarks.synthetic in a SQLite file. StandInConnection
+wraps a connection to it with the part of the oracledb connection API the queries use: cursor()
+with arraysize, prefetchrows, execute, description and fetchmany, and gettype().newobject() for
+collection binds. The Oracle statements are rewritten to SQLite on execute:
+
+    TO_DATE(:d, 'YYYY-MM-DD')              -> :d (timestamps are stored as ISO text)
+    TO_CHAR(x, 'YYYY_MM')                  -> strftime('%Y_%m', x)
+    TO_NUMBER(TO_CHAR(x, 'IW'))            -> ISOWEEK(x), a Python function
+    TRUNC(x)                               -> date(x)
+    day - :n                               -> date(day, '-' || :n || ' days')
+    SELECT column_value FROM TABLE(:list)  -> SELECT value FROM json_each(:list)
+
+This covers the redoInput, redoOutput, redoServerSide, data version and index sync statements.
+Dates computed by a statement, like TRUNC, come back as ISO text instead of datetime.
+"""
+import json
+import re
+import sqlite3
+from datetime import datetime
+
+# Timestamp columns come back as datetime, like Oracle DATE columns. pandas registers its own
+# converter for the DATE declared type, so the columns get a type name of their own.
+DATE_TYPE = "ORADATE"
+sqlite3.register_converter(DATE_TYPE, lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+INDEXES = {
+    'opticket': ("COMPLETEDTIME", "TICKETNO"),
+    'opbase': ("ID",),
+    'nspusers': ("USERID",),
+    'nspwarehouses': ("WAREHOUSEID",),
+}
+
+_FORMATS = {'YYYY': '%Y', 'MM': '%m', 'DD': '%d'}
+_TO_DATE = re.compile(r"TO_DATE\((:\w+),\s*'[^']*'\)", re.IGNORECASE)
+_TO_CHAR = re.compile(r"TO_CHAR\(([\w.]+),\s*'([^']*)'\)", re.IGNORECASE)
+_ISO_WEEK = re.compile(r"TO_NUMBER\(TO_CHAR\(([\w.]+),\s*'IW'\)\)", re.IGNORECASE)
+_TRUNC = re.compile(r"TRUNC\(([\w.]+)\)", re.IGNORECASE)
+# Oracle subtracts days from a DATE, only a bind is subtracted in the statements
+_MINUS_DAYS = re.compile(r"(\w+)\s*-\s*(:\w+)")
+_TABLE = re.compile(r"SELECT\s+column_value\s+FROM\s+TABLE\((:\w+)\)", re.IGNORECASE)
+
+
+def _strftime(match):
+    oracle_format = match.group(2)
+    for token, directive in _FORMATS.items():
+        oracle_format = re.sub(token, directive, oracle_format, flags=re.IGNORECASE)
+    return f"strftime('{oracle_format}', {match.group(1)})"
+
+
+def translate(query):
+    """SQLite text of an Oracle statement"""
+    query = _TO_DATE.sub(r"\1", query)
+    query = _ISO_WEEK.sub(r"ISOWEEK(\1)", query)
+    query = _TO_CHAR.sub(_strftime, query)
+    query = _TRUNC.sub(r"date(\1)", query)
+    query = _MINUS_DAYS.sub(r"date(\1, '-' || \2 || ' days')", query)
+    return _TABLE.sub(r"SELECT value FROM json_each(\1)", query)
+
+
+def writeTables(tables, path):
+    """Store {table name: DataFrame} in the SQLite file at path, replacing tables that exist"""
+    import pandas as pd
+
+    connection = sqlite3.connect(path)
+    try:
+        for name, df in tables.items():
+            dtypes = {column: DATE_TYPE for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])}
+            df = df.assign(**{column: df[column].dt.strftime('%Y-%m-%d %H:%M:%S') for column in dtypes})
+            df.to_sql(name, connection, if_exists="replace", index=False, dtype=dtypes, chunksize=50000)
+            for column in INDEXES.get(name, ()):
+                connection.execute(f"CREATE INDEX {name}_{column} ON {name} ({column})")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _isoWeek(value):
+    return None if value is None else datetime.fromisoformat(value).isocalendar().week
+
+
+class _Collection:
+    def newobject(self, values):
+        return json.dumps(list(values))
+
+
+class _Cursor:
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+        self.arraysize = 100
+        self.prefetchrows = 2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def description(self):
+        # Oracle returns unquoted identifiers in upper case
+        return [(column[0].upper(),) + column[1:] for column in self._cursor.description]
+
+    def execute(self, query, parameters=None, **keyword_parameters):
+        self._cursor.execute(translate(query), {**(parameters or {}), **keyword_parameters})
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self.arraysize)
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandInConnection:
+    """oracledb.Connection look-alike on a SQLite file"""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._connection.create_function("ISOWEEK", 1, _isoWeek, deterministic=True)
+
+    def cursor(self):
+        return _Cursor(self._connection)
+
+    def gettype(self, name):
+        return _Collection()
+
+    def ping(self):
+        pass
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,158 @@
+"""Synthetic ticket data for the benchmarks.
+
+makeTables builds the opticket, opbase, nspusers and nspwarehouses tables the redo queries read,
+with every serial getting repeat visits at a given repair rate. makeRedoInput and makeRedoOutput
+build the frames of one pipeline stage directly, for benchmarks that start in the middle of it.
+"""
+import numpy as np
+import pandas as pd
+
+# Repeat visits of one serial are chained, this caps the chain
+MAX_VISITS = 6
+
+
+def _choice(rng, prefix, count, size):
+    return np.char.add(prefix, rng.integers(0, count, size).astype(str)).astype(object)
+
+
+def makeTables(serials=100000, repair_rate=0.15, start_date='2024-01-01', days=365, accounts=20,
+               warehouses=40, techs=500, revisit_days=120, seed=0):
+    """Synthetic source tables as {table name: DataFrame}, with Oracle column names.
+
+    Every serial gets a first visit in [start_date, start_date + days). After each visit it comes
+    back with probability repair_rate, 1 to revisit_days days after the completion, so with the
+    default 90 day lookback about three in four repeat visits are redos. A few percent of the
+    tickets are carry-in, out of warranty, cancelled or of another vendor and get filtered out.
+    TICKETNO and opbase ids follow the assign time, like the ticket sequence does."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(start_date, 's')
+    end = start + np.timedelta64(days, 'D')
+
+    # Attributes of the appliance, shared by every ticket of a serial
+    serial_model = rng.integers(0, 200, serials)
+    serial_account = rng.integers(0, accounts, serials)
+    serial_warehouse = rng.integers(0, warehouses, serials)
+
+    serial_index, assigned = [], []
+    current = np.arange(serials)
+    current_assign = start + rng.integers(0, days * 86400, serials).astype('timedelta64[s]')
+    for _ in range(MAX_VISITS):
+        serial_index.append(current)
+        assigned.append(current_assign)
+        completed = current_assign + rng.integers(3600, 5 * 86400, len(current)).astype('timedelta64[s]')
+        again = rng.random(len(current)) < repair_rate
+        current = current[again]
+        current_assign = completed[again] + rng.integers(86400, revisit_days * 86400, len(current)).astype('timedelta64[s]')
+        inside = current_assign < end
+        current, current_assign = current[inside], current_assign[inside]
+        if not len(current):
+            break
+
+    serial_index = np.concatenate(serial_index)
+    assigned = np.concatenate(assigned)
+    order = np.argsort(assigned, kind='stable')
+    serial_index, assigned = serial_index[order], assigned[order]
+    tickets = len(assigned)
+    completed = assigned + rng.integers(3600, 5 * 86400, tickets).astype('timedelta64[s]')
+    issued = assigned - rng.integers(0, 3 * 86400, tickets).astype('timedelta64[s]')
+    ids = np.arange(1, tickets + 1)
+
+    models = np.char.add('MODEL', np.arange(200).astype(str)).astype(object)
+    opticket = pd.DataFrame({
+        'TICKETNO': ids + 4000000000,
+        'ID': ids,
+        'WAREHOUSEID': serial_warehouse[serial_index] + 1,
+        'TECHID': rng.integers(1, techs + 1, tickets),
+        'ACCOUNTNO': (serial_account[serial_index] + 1000000000).astype(str).astype(object),
+        'BUILDERNAME': _choice(rng, 'BUILDER ', 25, tickets),
+        'PRODUCTTYPE': np.array(['REF', 'WM', 'DRY', 'OVEN', 'DW', 'MWO'], dtype=object)[serial_model % 6][serial_index],
+        'SERVICETYPE': np.where(rng.random(tickets) < 0.05, 'CI', 'IH').astype(object),
+        'MODELNO': models[serial_model[serial_index]],
+        'SERIALNO': np.char.add('SN', serial_index.astype(str)).astype(object),
+        'VENDORID': np.where(rng.random(tickets) < 0.02, 0, 1),
+        'SYSTEMID': 2,
+        'WARRANTYSTATUS': rng.choice(np.array(['IW', 'YES', 'POP', 'OOW'], dtype=object), tickets, p=[0.6, 0.15, 0.15, 0.1]),
+        'ASSIGNDTIME': assigned,
+        'APTSTARTDTIME': assigned + np.timedelta64(1, 'D'),
+        'ISSUEDTIME': issued,
+        'COMPLETEDTIME': completed,
+        'BRAND': np.array(['SAMSUNG', 'LG', 'WHIRLPOOL'], dtype=object)[serial_model % 3][serial_index],
+    })
+    opbase = pd.DataFrame({
+        'ID': ids,
+        'UPDATEDBY': rng.choice(np.array(['SYSTEM', 'DISPATCH', 'TECH'], dtype=object), tickets),
+        'STATUS': np.where(rng.random(tickets) < 0.05, 70, 60),
+    })
+    nspusers = pd.DataFrame({
+        'USERID': np.arange(1, techs + 1),
+        'FIRSTNAME': np.char.add('TECH', np.arange(1, techs + 1).astype(str)).astype(object),
+        'LASTNAME': _choice(rng, 'LAST', 100, techs),
+    })
+    nspwarehouses = pd.DataFrame({
+        'WAREHOUSEID': np.arange(1, warehouses + 1),
+        'NICKNAME': np.char.add('WH', np.arange(1, warehouses + 1).astype(str)).astype(object),
+    })
+    return {'opticket': opticket, 'opbase': opbase, 'nspusers': nspusers, 'nspwarehouses': nspwarehouses}
+
+
+def makeRedoInput(rows, seed=0):
+    """Synthetic frame with the columns and dtypes read_sql returns for the redoInput query"""
+    rng = np.random.default_rng(seed)
+    assigned = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    completed = assigned + pd.to_timedelta(rng.integers(0, 10, rows), unit='D')
+    return pd.DataFrame({
+        'TICKETNO': rng.permutation(rows) + 4000000000,
+        'NICKNAME': rng.choice(['DALLAS', 'HOUSTON', 'AUSTIN', 'ATLANTA'], rows).astype(object),
+        'ACCOUNTNO': rng.choice(['1234567890', '0987654321'], rows).astype(object),
+        'BUILDERNAME': rng.choice(['BUILDER A', 'BUILDER B'], rows).astype(object),
+        'PRODUCTTYPE': rng.choice(['REF', 'WM', 'DRY', 'OVEN'], rows).astype(object),
+        'SERVICETYPE': 'IH',
+        'MODELNO': rng.choice([f'MODEL{i}' for i in range(50)], rows).astype(object),
+        'SERIALNO': [f'SN{i}' for i in rng.integers(0, rows // 2 + 1, rows)],
+        'UPDATEDBY': 'SYSTEM',
+        'VENDORID': 'GSPN',
+        'WARRANTYSTATUS': rng.choice(['IW', 'YES', 'POP', 'OOW'], rows).astype(object),
+        'ASSIGNDATE': assigned.strftime('%Y-%m-%d').astype(object),
+        'APPTDATE': assigned.strftime('%Y-%m-%d').astype(object),
+        'OPENDATE': assigned.strftime('%Y-%m-%d').astype(object),
+        'COMPLETEDATE': completed.strftime('%Y-%m-%d').astype(object),
+        'COMPLETEMONTH': completed.strftime('%Y_%m').astype(object),
+        'STATUS': 60,
+        'BRAND': rng.choice(['SAMSUNG', 'LG'], rows).astype(object),
+        'TECHID': rng.integers(1, 500, rows),
+        'TECHNAME': rng.choice([f'TECH {i}' for i in range(500)], rows).astype(object),
+    })
+
+
+def makeRedoOutput(rows, seed=0):
+    """Synthetic frame with the columns and dtypes of the mergeWithRedo output"""
+    rng = np.random.default_rng(seed)
+    completed = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    assigned = completed - pd.to_timedelta(rng.integers(0, 10, rows), unit='D')
+    has_redo = rng.random(rows) < 0.1
+    redo_complete = (completed - pd.to_timedelta(rng.integers(1, 90, rows), unit='D')).where(has_redo)
+    return pd.DataFrame({
+        'TICKETNO': rng.integers(4000000000, 4100000000, rows),
+        'NICKNAME': rng.choice(['DALLAS', 'HOUSTON', 'AUSTIN', 'ATLANTA'], rows),
+        'ACCOUNTNO': rng.choice(['1234567890', '0987654321'], rows),
+        'BUILDERNAME': rng.choice(['BUILDER A', 'BUILDER B'], rows),
+        'PRODUCTTYPE': rng.choice(['REF', 'WM', 'DRY', 'OVEN'], rows),
+        'SERVICETYPE': 'IH',
+        'MODELNO': rng.choice([f'MODEL{i}' for i in range(50)], rows),
+        'SERIALNO': [f'SN{i}' for i in rng.integers(0, rows // 2 + 1, rows)],
+        'UPDATEDBY': 'SYSTEM',
+        'VENDORID': 'GSPN',
+        'WARRANTYSTATUS': rng.choice(['IW', 'YES', 'POP'], rows),
+        'ASSIGNDATE': assigned,
+        'APPTDATE': assigned.strftime('%Y-%m-%d'),
+        'OPENDATE': assigned.strftime('%Y-%m-%d'),
+        'COMPLETEDATE': completed,
+        'COMPLETEMONTH': completed.strftime('%Y_%m'),
+        'STATUS': 60,
+        'BRAND': rng.choice(['SAMSUNG', 'LG'], rows),
+        'TECHID_x': rng.integers(1, 500, rows),
+        'TECHNAME': rng.choice([f'TECH {i}' for i in range(500)], rows),
+        'WEEK': completed.isocalendar().week.to_numpy(),
+        'REDOTKTNO': np.where(has_redo, rng.integers(4000000000, 4100000000, rows), np.nan),
+        'REDOCALCCOMPLETE': redo_complete,
+    })